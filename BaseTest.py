@@ -1,12 +1,8 @@
-import os, sys, time, urllib.parse
+import atexit, os, sys, threading, time, unittest, urllib.parse
 
-import requests
-
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
-from selenium.webdriver.support.select import Select
-
-import PortalBrowser
+# Selenium, requests and the modules that use them are imported when they
+# are first needed, so that discovering and selecting tests is fast.
+import DriverFactory
 
 # To run workflows as registered user, add a username and password to config.py,
 # Otherwise workflows are run as the guest user. config.py example:
@@ -16,151 +12,583 @@ import PortalBrowser
 starturl = 'http://beta.biovel.eu/'
 username = None
 password = None
+# Directory for diagnostic files saved during tests. None uses the current
+# directory.
+artifactBase = None
+# Browsers are reused between tests. A browser is replaced after it has been
+# used for browserMaxUses tests (use 1 to start a new browser for each test),
+# or when its memory use grows by more than browserMaxMemoryGrowth bytes
+# (requires psutil). None means no limit.
+browserMaxUses = 20
+browserMaxMemoryGrowth = 500 * 1024 * 1024
+# Directory for files cached between test sessions
+cacheDir = '.cache'
+# Changes to the browser settings in DriverFactory.defaultBrowsers, e.g.
+# browsers = {'Firefox': {'headless': True}, 'Chrome': None}
+browsers = {}
+# Upload workflows, start runs of uploaded workflows, and delete workflows
+# and runs using HTTP requests, rather than through the browser
+httpSetup = True
+# Wait for run status changes by observing the status element in the browser,
+# rather than polling it
+statusObserver = True
+# Type workflow input values key by key in the browser, rather than setting
+# them directly
+typeInputs = False
+# Use only the input files already in the fixture cache, without checking
+# them for changes or downloading missing files
+offline = False
+# Upload each workflow file once per session, and share it between the tests
+# that run it, rather than uploading and deleting it in each test. Used only
+# when running as a registered user.
+shareWorkflows = True
+# Number of the parallel worker process running the tests, set by
+# ParallelRunner. Each worker uploads its own shared workflows.
+workerId = None
+# Sign in through the browser once per session, and sign in later browser
+# sessions by giving them the cookies of the first session
+reuseLogin = True
+# Write a report of the time spent in each wait and sleep, for each test and
+# for the whole session, to the artifact directory
+waitReport = False
+# Record each command sent to the browser, and write a trace of them for each
+# test to the artifact directory
+traceCommands = False
+# Write the time each run status was first seen, for the runs in each test,
+# to the artifact directory
+saveTimelines = False
+# When screenshots are saved, a screenshot is only rewritten if more than
+# this fraction of its pixels have changed. None rewrites all screenshots.
+screenshotThreshold = 0.001
+# Record the responses to downloads of run outputs and input files in a
+# cassette in the cache directory ('record'), replay them from it without
+# using the network ('replay'), or replay those recorded and record others
+# ('auto'). None downloads as usual.
+cassette = None
+# Seconds before each replayed response starts, and bytes a second at which
+# replayed responses are read (None for no limit)
+cassetteLatency = 0.0
+cassetteBandwidth = None
+# When a run fails, save the page source, a screenshot, the run status
+# timelines and the run log to failures/TESTID in the artifact directory
+captureFailures = True
+# Largest size of each item saved when a run fails. Longer text is cut short,
+# and larger screenshots are not kept.
+failureMaxBytes = 4 * 1024 * 1024
 try:
     from config import *
 except ImportError:
     pass
 
-class WithFirefox:
+# Create the browser mixin classes (WithFirefox, WithChrome, ...) from the
+# browser settings
+browserSettings = DriverFactory.browserSettings(browsers)
+for _name, _settings in browserSettings.items():
+    globals()['With' + _name] = DriverFactory.browserMixin(
+        _name, _settings, os.path.join(cacheDir, 'browsers.json')
+        )
+del _name, _settings
 
-    def screenshotTag(self):
-        return 'ffx'
 
-    def getBrowser(self):
-        driver = webdriver.Firefox()
-        driver.set_window_size(1024,640)
-        return driver
+# Session cleanups are called once, when all tests in the process have run
+_sessionCleanups = []
 
+def addSessionCleanup(function, *args, **kwargs):
+    _sessionCleanups.append((function, args, kwargs))
 
-# Test if Chromium browser (Google Chrome) is available
-print('Checking availability of Chromium...', end='')
-try:
-    chrome = webdriver.Chrome()
-except WebDriverException as exc:
-    print('no:', exc, sep='\n')
-    WithChrome = None
-else:
-    print('yes')
-    chrome.quit()
-    class WithChrome:
-        def screenshotTag(self):
-            return 'chr'
-
-        def getBrowser(self):
-            return webdriver.Chrome()
+def doSessionCleanups():
+    while _sessionCleanups:
+        function, args, kwargs = _sessionCleanups.pop()
+        try:
+            function(*args, **kwargs)
+        except Exception as exc:
+            print('Session cleanup failed:', exc, file=sys.stderr)
+
+atexit.register(doSessionCleanups)
+
+_sessionPool = None
+
+def getSessionPool():
+    global _sessionPool
+    if _sessionPool is None:
+        import SessionPool
+        _sessionPool = SessionPool.SessionPool(browserMaxUses, browserMaxMemoryGrowth)
+        addSessionCleanup(_sessionPool.closeAll)
+    return _sessionPool
+
+_cassette = None
+
+def getCassette():
+    # Return the Cassette used for downloads, or None
+    global _cassette
+    if _cassette is None and cassette:
+        import Cassette
+        _cassette = Cassette.Cassette(
+            os.path.join(cacheDir, 'cassette'), cassette, cassetteLatency, cassetteBandwidth
+            )
+    return _cassette
+
+_fixtureCache = None
+
+def getFixtureCache():
+    global _fixtureCache
+    if _fixtureCache is None:
+        import FixtureCache
+        session = None
+        if getCassette():
+            import requests
+            session = getCassette().mount(requests.Session())
+        _fixtureCache = FixtureCache.FixtureCache(os.path.join(cacheDir, 'fixtures'), offline, session)
+    return _fixtureCache
+
+_sharedWorkflows = None
+
+def getSharedWorkflows():
+    global _sharedWorkflows
+    if _sharedWorkflows is None:
+        import hashlib, PortalClient, SharedWorkflows
+        client = PortalClient.PortalClient(starturl)
+        client.signIn(username, password)
+        owner = '{0} {1} {2}'.format(starturl, username, workerId)
+        recordFile = os.path.join(
+            cacheDir, 'workflows', hashlib.sha1(owner.encode('utf-8')).hexdigest()[:16] + '.json'
+            )
+        _sharedWorkflows = SharedWorkflows.SharedWorkflows(client, recordFile)
+        def removeSharedWorkflows():
+            # Sign in again, in case the session has expired
+            client.signIn(username, password)
+            _sharedWorkflows.removeAll()
+        addSessionCleanup(removeSharedWorkflows)
+    return _sharedWorkflows
+
+# Cookies of a browser session signed in as username, if reuseLogin is set
+_loginCookies = None
+
+def saveLoginCookies(cookies):
+    global _loginCookies
+    if _loginCookies is None:
+        # Sign out at the end of the session, as tests using the saved
+        # cookies do not sign out
+        addSessionCleanup(signOutLoginCookies)
+    _loginCookies = cookies
+
+def signOutLoginCookies():
+    import PortalClient
+    client = PortalClient.PortalClient(starturl)
+    for cookie in _loginCookies or ():
+        client.session.cookies.set(cookie['name'], cookie['value'], path=cookie.get('path', '/'))
+    client.signOut()
+
+_screenshotWriter = None
+
+def getScreenshotWriter():
+    global _screenshotWriter
+    if _screenshotWriter is None:
+        import ScreenshotWriter
+        _screenshotWriter = ScreenshotWriter.ScreenshotWriter(threshold=screenshotThreshold)
+        addSessionCleanup(_screenshotWriter.writeReport)
+    return _screenshotWriter
+
+_failureCapture = None
+
+def getFailureCapture():
+    global _failureCapture
+    if _failureCapture is None:
+        import FailureCapture
+        _failureCapture = FailureCapture.FailureCapture(failureMaxBytes)
+        addSessionCleanup(_failureCapture.report)
+    return _failureCapture
+
+# Total time spent in each wait and sleep by all tests in the session, by
+# kind and name
+_sessionWaits = {}
+
+def addSessionWaits(waitLog):
+    if not _sessionWaits:
+        addSessionCleanup(writeSessionWaits)
+    for record in waitLog:
+        key = '{0} {1}'.format(record['kind'], record['name'])
+        total = _sessionWaits.setdefault(key, {'count': 0, 'seconds': 0.0, 'max': 0.0})
+        total['count'] += 1
+        total['seconds'] += record['seconds']
+        total['max'] = max(total['max'], record['seconds'])
+
+def writeSessionWaits():
+    import json
+    filename = os.path.join(artifactBase or '.', 'waits-session.json')
+    with open(filename, 'wt') as f:
+        json.dump(_sessionWaits, f, indent=2, sort_keys=True)
+    print('Longest waits:', file=sys.stderr)
+    totals = sorted(_sessionWaits.items(), key=lambda item: item[1]['seconds'], reverse=True)
+    for key, total in totals[:10]:
+        print('  {0:8.1f}s {1:4d}x {2}'.format(total['seconds'], total['count'], key), file=sys.stderr)
 
 
 class BaseTest:
 
+    @classmethod
+    def setUpClass(cls):
+        reason = cls.browserUnavailable()
+        if reason:
+            raise unittest.SkipTest(reason)
+        super().setUpClass()
+
     def setUp(self):
         module = sys.modules[self.__class__.__module__]
         if 'pause' in dir(module) and module.pause:
             self.addPause = True
         if 'screenshotBase' in dir(module):
             self.screenshotBase = module.screenshotBase
-        self.browser = self.getBrowser()
-        # ensure browser quit is called, even if setUp fails
+        # Waits and sleeps, kept for the whole test, even if the browser is
+        # restarted
+        self.waitLog = []
+        if waitReport:
+            self.addCleanup(self.reportWaits)
+        self.trace = None
+        if traceCommands:
+            import CommandTrace
+            self.trace = CommandTrace.CommandTrace(self.waitLog)
+            self.trace.setStage('setup')
+            self.addCleanup(self.writeTrace)
+        if self.screenshotBase:
+            # Report any screenshots that could not be written with the test
+            self.addCleanup(getScreenshotWriter().flush)
+        self.browser = self.acquireBrowser()
+        # ensure browser is released, even if setUp fails
         self.addCleanup(self.browserQuit)
-        self.portal = PortalBrowser.PortalBrowser(self.browser, starturl)
+        self.portal = self.openPortal()
+        self.portal.setStage('test')
+
+    def openPortal(self):
+        import PortalBrowser
+        return PortalBrowser.PortalBrowser(
+            self.browser, starturl, observeStatus=statusObserver, typeInputs=typeInputs,
+            waitLog=self.waitLog, trace=self.trace
+            )
+
+    def acquireBrowser(self):
+        return getSessionPool().acquire(self.browserName, self.getBrowser)
+
+    def doCleanups(self):
+        # Cleanups run last-registered first, so name the stage before any of
+        # them run, including those added during the test (e.g. removing
+        # runs), and even if setUp failed
+        if getattr(self, 'trace', None) is not None:
+            self.trace.setStage('cleanup')
+        return super().doCleanups()
 
     def browserQuit(self):
         if self.browser:
             # short sleep, so anyone viewing can see final state of browser
             self.pause(2)
-            self.browser.quit()
+            getSessionPool().release(self.browser, starturl)
+            self.browser = None
 
     def restartBrowser(self):
-        self.browser.quit()
+        # Releasing the browser clears the session, so the browser that is
+        # acquired behaves like a newly started browser.
+        getSessionPool().release(self.browser, starturl)
         self.browser = None
-        self.browser = self.getBrowser()
-        self.portal = PortalBrowser.PortalBrowser(self.browser, starturl)
+        self.browser = self.acquireBrowser()
+        self.portal = self.openPortal()
 
     addPause = False
 
     def pause(self, t):
         if self.addPause:
             time.sleep(t)
+            self.waitLog.append({'kind': 'sleep', 'name': 'pause', 'start': time.time() - t, 'seconds': t})
+
+    def reportWaits(self):
+        import json
+        with open(self.artifactName('waits-{0}.json'.format(self.id())), 'wt') as f:
+            json.dump(self.waitLog, f, indent=2)
+        addSessionWaits(self.waitLog)
+
+    def writeTrace(self):
+        self.trace.uninstall()
+        summary = self.trace.write(self.artifactName('trace-{0}.json'.format(self.id())), self.id())
+        print(
+            '{0}: {elapsed:.1f}s = webdriver {webdriver:.1f}s ({commands} commands) + '
+            'waits {waits:.1f}s + sleeps {sleeps:.1f}s + other {other:.1f}s (harness CPU {cpu:.1f}s)'.format(
+                self.id(), **summary
+                ),
+            file=sys.stderr
+            )
+
+    def fixture(self, name, url=None):
+        # Return the path of a local copy of the input file called name,
+        # downloading it from url if it is not cached. url can be a function
+        # returning the URL, so it is only found when needed.
+        return getFixtureCache().get(name, url)
 
     screenshotBase = None
 
+    def artifactName(self, filename):
+        # Files kept for diagnosis go in the artifact directory, if one is
+        # set (e.g. by ParallelRunner, which gives each worker its own)
+        if artifactBase:
+            os.makedirs(artifactBase, exist_ok=True)
+            return os.path.join(artifactBase, filename)
+        return filename
+
+    def captureFailure(self, label):
+        # Save the state of the browser in the background, and return the
+        # name of the snapshot's info file, and the text of each element in
+        # the Advanced section of the page (None if there is none)
+        from selenium.common.exceptions import WebDriverException
+        state = self.portal.getFailureState()
+        try:
+            png = self.portal.get_screenshot_as_png()
+        except WebDriverException:
+            png = None
+        timelines = [run.exportTimeline() for run in getattr(self, 'runs', ())]
+        directory = self.artifactName(os.path.join('failures', self.id()))
+        infoFile = getFailureCapture().capture(directory, label, state, png, timelines)
+        return infoFile, state['advanced']
+
     def screenshotName(self, stub):
         return os.path.join(self.screenshotBase, '%s-%s.png' % (stub, self.screenshotTag()))
 
     def screenshot(self, stubname, location=None, size=None):
+        # The screenshot is taken in memory, and written in the background
         if self.screenshotBase:
+            png = self.portal.get_screenshot_as_png()
+            writer = getScreenshotWriter()
             if location is None:
-                self.portal.save_screenshot(self.screenshotName(stubname))
+                writer.write(self.screenshotName(stubname), png)
             else:
-                tmpfile = self.screenshotName(stubname + '-full')
-                self.portal.save_screenshot(tmpfile)
-                from PIL import Image
-                # Pass an open file handle to PIL, to allow proper closure
-                # (at end of with block) as Python now warns about deleted
-                # unclosed files
-                with open(tmpfile, 'rb') as f:
-                    im = Image.open(f)
-                    # Chromium returns floats, but PIL requires ints
-                    left = int(location['x'])
-                    top = int(location['y'])
-                    right = left + int(size['width'])
-                    bottom = top + int(size['height'])
-                    self.assertGreater(right, left)
-                    self.assertGreater(bottom, top)
-                    im = im.crop((left, top, right, bottom))
-                    im.save(self.screenshotName(stubname + '-crop'))
+                writer.write(self.screenshotName(stubname + '-full'), png)
+                # Chromium returns floats, but PIL requires ints
+                left = int(location['x'])
+                top = int(location['y'])
+                right = left + int(size['width'])
+                bottom = top + int(size['height'])
+                self.assertGreater(right, left)
+                self.assertGreater(bottom, top)
+                writer.write(self.screenshotName(stubname + '-crop'), png, (left, top, right, bottom))
+
+    def renameScreenshot(self, stub, newStub):
+        # The screenshot is renamed once it has been written
+        getScreenshotWriter().rename(self.screenshotName(stub), self.screenshotName(newStub))
+
+    def removeScreenshot(self, stub):
+        getScreenshotWriter().remove(self.screenshotName(stub))
 
 def wraplist(value):
-    if isinstance(value, str):
-        pass
-    else:
-        try:
-            # list, tuple
-            value = '[' + ','.join([wraplist(v) for v in value]) + ']'
-        except TypeError:
-            # int, float
-            value = str(value)
-    return value
+    # Return value as a Taverna list string
+    import TavernaList
+    return TavernaList.encode(value)[0]
+
+class ResultTooLarge(Exception):
+    pass
+
 
 class WorkflowResult:
 
-    def __init__(self, portal, mimeType, downloadLink):
-        self.portal = portal
+    chunkSize = 64 * 1024
+
+    def __init__(self, client, mimeType, downloadLink):
+        # client is a PortalClient, whose keep-alive connections to the
+        # portal are shared by all results
+        self.client = client
         self.mimeType = mimeType
         self.downloadLink = downloadLink
+        # The whole value, once fetched, and the encoding given by the portal
+        self.body = None
+        self.encoding = None
+        self.lock = threading.Lock()
 
     def getMimeType(self):
         return self.mimeType
 
-    def getValue(self):
-        cookies = {cookie['name']: cookie['value'] for cookie in self.portal.get_cookies()}
-        r = requests.get(self.downloadLink, cookies=cookies)
-        r.connection.close()
-        return r.text
+    def isError(self):
+        return self.mimeType == 'application/x-error'
+
+    def checkSize(self, size, maxBytes):
+        if maxBytes is not None and size > maxBytes:
+            raise ResultTooLarge('{0} is larger than {1} bytes'.format(self.downloadLink, maxBytes))
+
+    def fetch(self, maxBytes=None):
+        # Download the whole value, unless it has already been fetched, and
+        # return it as bytes
+        with self.lock:
+            if self.body is None:
+                self.body = b''.join(self.iterChunks(maxBytes))
+        self.checkSize(len(self.body), maxBytes)
+        return self.body
+
+    def iterChunks(self, maxBytes=None):
+        # Return the value in chunks of bytes, raising ResultTooLarge if it
+        # is bigger than maxBytes. Values that have not been fetched are
+        # downloaded as they are read, without being kept.
+        if self.body is not None:
+            self.checkSize(len(self.body), maxBytes)
+            for start in range(0, len(self.body), self.chunkSize):
+                yield self.body[start:start + self.chunkSize]
+            return
+        with self.client.downloads.get(self.downloadLink, stream=True) as r:
+            self.encoding = r.encoding
+            size = 0
+            for chunk in r.iter_content(self.chunkSize):
+                size += len(chunk)
+                self.checkSize(size, maxBytes)
+                yield chunk
+
+    def iterText(self, encoding=None, maxBytes=None):
+        # Return the value as chunks of text, decoded using encoding, or
+        # the encoding given by the portal
+        import codecs
+        chunks = self.iterChunks(maxBytes)
+        # Reading the first chunk starts the download, which sets encoding
+        first = next(chunks, b'')
+        decoder = codecs.getincrementaldecoder(encoding or self.encoding or 'utf-8')('replace')
+        yield decoder.decode(first)
+        for chunk in chunks:
+            yield decoder.decode(chunk)
+        yield decoder.decode(b'', True)
+
+    def iterLines(self, encoding=None, maxBytes=None):
+        # Download the value as lines of text, keeping the line endings
+        pending = ''
+        for text in self.iterText(encoding, maxBytes):
+            lines = (pending + text).splitlines(True)
+            # A final \r may be the start of a \r\n split between chunks
+            pending = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+            yield from lines
+        if pending:
+            yield pending
+
+    def getBytes(self, maxBytes=None):
+        return self.fetch(maxBytes)
+
+    def getValue(self, encoding=None, maxBytes=None):
+        body = self.fetch(maxBytes)
+        return body.decode(encoding or self.encoding or 'utf-8', 'replace')
+
+    def countLines(self, maxBytes=None):
+        # Count the newlines in the value, without decoding it
+        return sum(chunk.count(b'\n') for chunk in self.iterChunks(maxBytes))
+
+    def getDigest(self, algorithm='sha256', maxBytes=None):
+        import hashlib
+        digest = hashlib.new(algorithm)
+        for chunk in self.iterChunks(maxBytes):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def saveTo(self, path, maxBytes=None):
+        # Save the value to a file, returning the number of bytes written
+        size = 0
+        with open(path, 'wb') as f:
+            for chunk in self.iterChunks(maxBytes):
+                f.write(chunk)
+                size += len(chunk)
+        return size
+
+
+class WorkflowResults(dict):
+    '''The results of a workflow run, by output name.'''
+
+    maxWorkers = 8
+
+    def fetchAll(self, results):
+        # Download the values of results concurrently
+        import concurrent.futures
+        results = [result for result in results if result.body is None]
+        if len(results) > 1:
+            with concurrent.futures.ThreadPoolExecutor(min(self.maxWorkers, len(results))) as executor:
+                for body in executor.map(WorkflowResult.fetch, results):
+                    pass
+        elif results:
+            results[0].fetch()
+
+    def prefetch(self):
+        # Download all values, so later reads do not wait for the portal
+        self.fetchAll(self.values())
+
+    def hasErrors(self):
+        return any(result.isError() for result in self.values())
+
+    def getErrors(self):
+        # Return the error messages of the outputs that are errors, by
+        # output name. Only error outputs are downloaded.
+        errors = {name: result for name, result in self.items() if result.isError()}
+        self.fetchAll(errors.values())
+        return {name: result.getValue() for name, result in errors.items()}
+
 
 class WorkflowRun:
 
-    def __init__(self, test, portal):
+    def __init__(self, test, portal, runURL=None, submitted=None, key=None):
+        # submitted is the time the run was submitted, if known. key is a
+        # name for runs of the same workflow with the same inputs, from
+        # Cassette.runKey, under which output downloads are recorded.
         self.test = test
+        self.key = key
         self.portal = portal
+        self.runURL = runURL
+        # The run statuses seen by the portal browser, and when. A run
+        # followed again (e.g. in a restarted browser) continues the
+        # timeline of the earlier WorkflowRun.
+        self.timeline = []
+        runs = getattr(test, 'runs', None)
+        earlier = [run for run in runs or () if runURL and run.runURL == runURL]
+        if earlier:
+            self.timeline = earlier[0].timeline
+        elif runs is not None:
+            runs.append(self)
+        if submitted is not None:
+            self.timeline.append({'time': submitted, 'status': 'Submitted', 'text': None})
+        portal.statusTimeline = self.timeline
+
+    def getPhases(self):
+        # Return the time spent in each status, in order. The last status
+        # lasts until now, if it is not Finished.
+        phases = []
+        for i, event in enumerate(self.timeline):
+            if i + 1 < len(self.timeline):
+                end = self.timeline[i + 1]['time']
+            elif event['status'] in ('Finished', 'Failed', 'Cancelled'):
+                break
+            else:
+                end = time.time()
+            phases.append((event['status'], end - event['time']))
+        return phases
+
+    def exportTimeline(self):
+        start = self.timeline[0]['time'] if self.timeline else None
+        return {
+            'url': self.runURL,
+            'events': [dict(event, elapsed=event['time'] - start) for event in self.timeline],
+            'phases': [{'status': status, 'seconds': seconds} for status, seconds in self.getPhases()],
+        }
 
     def waitForInteraction(self, *args, **kw):
         return self.portal.waitForInteraction(*args, **kw)
 
     def waitForFinish(self, *args, **kw):
+        self.portal.setStage('wait for finish')
         self.portal.watchRunStatus(self.test.waitForStatusFinished, *args, **kw)
-
-        results = {}
-
-        runOutputs = self.portal.find_element_by_id('run-outputs')
-        for output in runOutputs.find_elements_by_xpath('.//div[@class="output"]'):
-            name = output.find_element_by_xpath('./a[@id]').get_attribute('id')
-            mimeTypeSpan = output.find_element_by_xpath('.//span[@class="mime_type"]')
-            self.test.assertRegex(mimeTypeSpan.text, r'^\([^)]+\)$')
-            mimeType = mimeTypeSpan.text[1:-1] # remove outer parentheses
-            downloadLink = output.find_element_by_xpath('.//a[@href]').get_attribute('href')
-            fullUrl = urllib.parse.urljoin(self.portal.current_url, downloadLink)
+        self.portal.setStage('results')
+
+        # Downloads use the browser's current session
+        client = self.test.client
+        client.copyCookies(self.portal)
+        results = WorkflowResults()
+
+        pageUrl, outputs = self.portal.getRunOutputs()
+        for output in outputs:
+            name = output['name']
+            self.test.assertTrue(name, output)
+            self.test.assertIsNotNone(output['href'], output)
+            self.test.assertRegex(output['mimeType'] or '', r'^\([^)]+\)$')
+            mimeType = output['mimeType'][1:-1] # remove outer parentheses
+            fullUrl = urllib.parse.urljoin(pageUrl, output['href'])
             self.test.assertNotIn(name, results)
-            results[name] = WorkflowResult(self.portal, mimeType, fullUrl)
+            if self.key and getCassette():
+                getCassette().alias(fullUrl, '{0} output {1}'.format(self.key, name))
+            results[name] = WorkflowResult(client, mimeType, fullUrl)
 
         return results
 
@@ -170,26 +598,58 @@ class WorkflowTest(BaseTest):
 
     def setUp(self):
         BaseTest.setUp(self)
+        self.portal.setStage('setup')
         if username:
-            self.portal.signInWithPassword(username, password)
+            self.signIn()
         self.addCleanup(self.portalSignOut)
+        # HTTP client sharing the browser's portal session, used for
+        # downloading results and, if httpSetup is set, for setting up and
+        # removing workflows and runs
+        import PortalClient
+        self.client = PortalClient.PortalClient(starturl, cassette=getCassette())
+        self.client.copyCookies(self.portal)
+        # Runs started by the test, whose status timelines are saved
+        self.runs = []
+        if saveTimelines:
+            self.addCleanup(self.writeTimelines)
+        self.portal.setStage('test')
 
     def restartBrowser(self):
         super().restartBrowser()
         if username:
-            self.portal.signInWithPassword(username, password)
+            self.signIn()
+        self.client.copyCookies(self.portal)
+
+    def signIn(self):
+        if reuseLogin and _loginCookies is not None:
+            self.portal.restoreCookies(_loginCookies)
+            if self.portal.isSignedIn():
+                return
+            # The saved session has expired, so sign in again
+        self.portal.signInWithPassword(username, password)
+        if reuseLogin:
+            self.portal.wait(30).until(lambda browser: self.portal.isSignedIn())
+            saveLoginCookies(self.portal.get_cookies())
+
+    def writeTimelines(self):
+        import json
+        if self.runs:
+            with open(self.artifactName('timeline-{0}.json'.format(self.id())), 'wt') as f:
+                json.dump([run.exportTimeline() for run in self.runs], f, indent=2)
 
     def portalSignOut(self):
-        if username:
+        # Signing out would end the session shared by the other tests
+        if username and not reuseLogin:
             self.portal.signOut()
 
     def reportFailedRun(self):
-        advanced = self.portal.find_element_by_id('advanced')
-        # Click on title to make Advanced section visible. This is required
-        # in order to read the text attributes
-        advanced.find_element_by_xpath('.//*[@class="foldTitle"]').click()
-        outputs = advanced.find_elements_by_xpath('.//div[@class="foldContent"]/*')
-        messages = [(element.text.strip() or 'None') for element in outputs]
+        if captureFailures:
+            infoFile, texts = self.captureFailure('run-failed')
+            texts = list(texts) if texts is not None else ['No Advanced section']
+            texts.append('See {0}'.format(infoFile))
+        else:
+            texts = self.portal.getAdvancedSection()
+        messages = [(text or 'None') for text in texts]
         messages.insert(0, 'Workflow run failed:')
         self.fail('\n---\n'.join(messages))
 
@@ -217,6 +677,7 @@ class WorkflowTest(BaseTest):
             return True
 
     def cancelRunAtURL(self, runURL):
+        from selenium.common.exceptions import NoSuchElementException, TimeoutException
         # There may be an alert in the way, so acknowledge it.
         try:
             self.portal.acceptAlert(1)
@@ -261,6 +722,14 @@ class WorkflowTest(BaseTest):
         return True
 
     def removeRunAtURL(self, runURL):
+        if httpSetup:
+            if username:
+                self.client.deleteRun(runURL)
+            else:
+                # Guest user cannot delete workflow runs
+                self.client.cancelRun(runURL)
+            return
+
         if username:
             if self.cancelRunAtURL(runURL):
                 link = self.portal.find_element_by_partial_link_text("Delete")
@@ -272,19 +741,21 @@ class WorkflowTest(BaseTest):
             message = self.portal.getFlashError()
             if message:
                 self.assertIn('does not exist', self.portal.getFlashError())
-            elif self.portal.getRepoVersion() == 10550 and isinstance(self, WithFirefox):
+            elif self.portal.getCapabilities().deleteFlashMissing and isinstance(self, WithFirefox):
                 # portal 10550 does not display the flash message here
                 # Since it'll be history soon, don't bother notifying the error
                 pass
+            elif captureFailures:
+                infoFile, texts = self.captureFailure('run-not-deleted')
+                raise RuntimeError('"does not exist" not in flash error - see {0}'.format(infoFile))
             else:
-                filename = str(time.time()) + '.png'
-                self.portal.save_screenshot(filename)
-                raise RuntimeError('"does not exist" not in flash error - see {0}'.format(filename))
+                raise RuntimeError('"does not exist" not in flash error')
         else:
             # Guest user cannot delete workflow runs
             self.cancelRunAtURL(runURL)
 
     def runExistingWorkflow(self, name, textInputs=None, fileInputs=None):
+        key = self.runKey(name, textInputs, fileInputs)
         link = self.portal.find_element_by_link_text(name)
         self.portal.click(link)
 
@@ -296,8 +767,7 @@ class WorkflowTest(BaseTest):
         inputs = self.portal.workflowInputs()
         if inputs:
             if textInputs:
-                for name, value in textInputs.items():
-                    value = wraplist(value)
+                for name, value in self.encodeInputs(textInputs).items():
                     inputs.setInputText(name, value)
                     self.pause(1)
             if fileInputs:
@@ -309,6 +779,7 @@ class WorkflowTest(BaseTest):
         self.screenshot('WorkflowInputs')
 
         start = self.portal.find_element_by_xpath("//input[@value='Start Run']")
+        submitted = time.time()
         start.click()
 
         success, message = result = self.portal.getFlashResult()
@@ -316,12 +787,27 @@ class WorkflowTest(BaseTest):
 
         runURL = self.portal.current_url
         self.addCleanup(self.removeRunAtURL, runURL)
+        run = WorkflowRun(self, self.portal, runURL, submitted, key)
 
+        self.portal.setStage('wait for running')
         self.portal.watchRunStatus(self.waitForStatusRunning, 600)
+        self.portal.setStage('test')
 
-        return WorkflowRun(self, self.portal)
+        return run
 
-    def runUploadedWorkflow(self, filename, topic, textInputs=None, fileInputs=None):
+    def runKey(self, workflow, textInputs, fileInputs):
+        # Name for the outputs of the run in the cassette, if one is used
+        if getCassette():
+            import Cassette
+            return Cassette.runKey(workflow, textInputs, fileInputs)
+        return None
+
+    def uploadWorkflow(self, filename, topic):
+        # Upload a workflow as a private workflow, and return its URL
+        if httpSetup:
+            return self.client.uploadWorkflow(os.path.join(os.getcwd(), filename), topic)
+
+        from selenium.webdriver.support.select import Select
         self.portal.selectWorkflowsTab()
 
         link = self.portal.find_element_by_partial_link_text('Upload a workflow')
@@ -353,8 +839,23 @@ class WorkflowTest(BaseTest):
 
         self.assertIn('Workflow was successfully updated', self.portal.getFlashNotice())
 
-        workflowURL = self.portal.current_url
-        self.addCleanup(self.removeWorkflowAtURL, workflowURL)
+        return self.portal.current_url
+
+    def startRun(self, workflowURL, textInputs=None, fileInputs=None):
+        # Start a run of the workflow, and return the run URL, with the run
+        # page loaded in the browser.  The text inputs are Taverna list
+        # strings, from encodeInputs.
+        if httpSetup:
+            runURL = self.client.startRun(
+                workflowURL,
+                textInputs or {},
+                {name: os.path.join(os.getcwd(), value) for name, value in (fileInputs or {}).items()}
+                )
+            self.portal.get(runURL)
+            return runURL
+
+        if self.portal.current_url != workflowURL:
+            self.portal.get(workflowURL)
 
         link = self.portal.find_element_by_partial_link_text("Run workflow")
         self.pause(1)
@@ -364,7 +865,6 @@ class WorkflowTest(BaseTest):
         if inputs:
             if textInputs:
                 for name, value in textInputs.items():
-                    value = wraplist(value)
                     inputs.setInputText(name, value)
                     self.pause(1)
             if fileInputs:
@@ -378,14 +878,49 @@ class WorkflowTest(BaseTest):
 
         self.assertIn('Run was successfully created', self.portal.getFlashNotice())
 
-        runURL = self.portal.current_url
+        return self.portal.current_url
+
+    def encodeInputs(self, textInputs, depths=None):
+        # Return the text inputs encoded as Taverna list strings, checking
+        # that no value is nested deeper than the depth of its input port
+        import TavernaList
+        encoded = {}
+        for name, value in (textInputs or {}).items():
+            try:
+                encoded[name], depth = TavernaList.encode(value)
+            except TavernaList.ListDepthError as exc:
+                self.fail('Workflow input "{0}": {1}'.format(name, exc))
+            if depths is not None:
+                self.assertIn(name, depths, 'No workflow input "{0}"'.format(name))
+                self.assertLessEqual(depth, depths[name], 'Depth of workflow input "{0}"'.format(name))
+        return encoded
+
+    def runUploadedWorkflow(self, filename, topic, textInputs=None, fileInputs=None):
+        import TavernaList
+        textInputs = self.encodeInputs(textInputs, TavernaList.inputDepths(filename))
+        if shareWorkflows and username:
+            workflowURL = getSharedWorkflows().get(filename, topic, self.uploadWorkflow)
+        else:
+            workflowURL = self.uploadWorkflow(filename, topic)
+            self.addCleanup(self.removeWorkflowAtURL, workflowURL)
+
+        key = self.runKey(filename, textInputs, fileInputs)
+        submitted = time.time()
+        runURL = self.startRun(workflowURL, textInputs, fileInputs)
         self.addCleanup(self.removeRunAtURL, runURL)
+        run = WorkflowRun(self, self.portal, runURL, submitted, key)
 
+        self.portal.setStage('wait for running')
         self.portal.watchRunStatus(self.waitForStatusRunning, 600)
+        self.portal.setStage('test')
 
-        return WorkflowRun(self, self.portal)
+        return run
 
     def removeWorkflowAtURL(self, workflowURL):
+        if httpSetup:
+            self.client.deleteWorkflow(workflowURL)
+            return
+
         self.portal.get(workflowURL)
 
         link = self.portal.find_element_by_partial_link_text("Manage workflow")
@@ -0,0 +1,97 @@
+'''Check whether a browser can be started by Selenium, caching the result.
+
+Starting a browser just to find out whether it works takes several seconds,
+so the result is saved in a cache file, keyed on the location, size and
+modification time of the driver executable. The browser is only started
+again when the driver changes.  Failures are retried after a day, in case the
+browser itself has been installed since.
+'''
+
+import json, os, shutil, subprocess, sys, time
+
+RETRY_FAILURE = 24 * 60 * 60
+
+# Results already found in this process
+_results = {}
+
+
+def driverKey(executable):
+    # Return a key identifying the installed driver, or None if not installed
+    path = shutil.which(executable)
+    if path is None:
+        return None
+    st = os.stat(path)
+    return '{0}:{1}:{2}'.format(os.path.realpath(path), st.st_size, int(st.st_mtime))
+
+
+def driverVersion(executable):
+    try:
+        output = subprocess.run(
+            [executable, '--version'], stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, timeout=10
+            ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.decode('utf-8', 'replace').strip()
+
+
+def loadCache(cacheFile):
+    try:
+        with open(cacheFile, 'rt') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def saveCache(cacheFile, cache):
+    # Parallel workers may save the cache at the same time, so each writes
+    # its own temporary file. The cache only saves time, so failing to save
+    # it is not an error.
+    tmpfile = cacheFile + '.{0}.tmp'.format(os.getpid())
+    try:
+        directory = os.path.dirname(cacheFile)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(tmpfile, 'wt') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmpfile, cacheFile)
+    except OSError as exc:
+        print('Cannot save {0}: {1}'.format(cacheFile, exc), file=sys.stderr)
+
+
+def unavailableReason(name, executable, start, cacheFile, variant=''):
+    # Return None if the browser can be used, otherwise a string describing
+    # why not. start is called to start the browser, and should quit it
+    # again, raising an exception if the browser is not usable. variant
+    # distinguishes different settings for the same browser.
+    cacheKey = name + variant
+    if cacheKey in _results:
+        return _results[cacheKey]
+    key = driverKey(executable)
+    if key is None:
+        reason = '{0} not found in PATH'.format(executable)
+    else:
+        cache = loadCache(cacheFile)
+        entry = cache.get(cacheKey)
+        if (entry and entry['key'] == key and
+                (entry['reason'] is None or time.time() - entry['checked'] < RETRY_FAILURE)):
+            reason = entry['reason']
+        else:
+            print('Checking availability of {0}...'.format(name), end='', flush=True)
+            try:
+                start()
+            except Exception as exc:
+                reason = '{0} cannot be started: {1}'.format(name, exc)
+                print('no:', exc, sep='\n')
+            else:
+                reason = None
+                print('yes')
+            cache[cacheKey] = {
+                'key': key,
+                'version': driverVersion(executable),
+                'reason': reason,
+                'checked': time.time(),
+                }
+            saveCache(cacheFile, cache)
+    _results[cacheKey] = reason
+    return reason
@@ -0,0 +1,255 @@
+'''Record HTTP responses, and replay them without using the network.
+
+A cassette is a transport adapter for requests sessions.  In record mode,
+each request is sent as usual, and the response is saved before it is
+returned.  In replay mode, the saved response is returned, and a request
+that was never recorded fails with CassetteMiss, as if the server could not
+be reached.  In auto mode, saved responses are replayed, and other requests
+are sent and recorded.
+
+Responses are kept in a directory holding an index of the requests, with
+the status, headers and body hash of the last response to each, and the
+bodies, gzip compressed and saved under their SHA-256 hash, so a body
+returned by many requests is stored once.  Replayed responses can be given
+a delay before the response starts, and a limited bandwidth, so that
+download and output checking code can be timed against a repeatable
+network.
+
+Run output URLs contain the id of the run, which is new in each session, so
+the harness gives each output download an alias naming the workflow, its
+inputs and the output, and the response is recorded and replayed under the
+alias.  A redirect from an aliased URL is followed under an alias too.
+
+The harness uses a cassette for the downloads of run outputs and input
+files, when the cassette setting is given in config.py.
+'''
+
+import gzip, hashlib, io, json, os, tempfile, threading, time, urllib.parse
+
+import requests
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    pass
+
+
+def runKey(workflow, textInputs=None, fileInputs=None):
+    # Return a name for runs of workflow with the same inputs, which is the
+    # same in every session
+    description = json.dumps([workflow, textInputs or {}, fileInputs or {}], sort_keys=True)
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+MODES = ('record', 'replay', 'auto')
+
+# Headers that describe the transfer rather than the content, and cookies,
+# which are not replayed
+DROPPED_HEADERS = frozenset((
+    'connection', 'content-encoding', 'content-length', 'keep-alive', 'set-cookie',
+    'transfer-encoding'
+    ))
+
+
+class ThrottledBody(io.RawIOBase):
+    # A file of response body bytes, read no faster than bandwidth bytes a
+    # second
+
+    def __init__(self, f, bandwidth=None):
+        self.f = f
+        self.bandwidth = bandwidth
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.f.read(len(buffer))
+        buffer[:len(data)] = data
+        if self.bandwidth:
+            time.sleep(len(data) / self.bandwidth)
+        return len(data)
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+class Cassette:
+
+    chunkSize = 64 * 1024
+
+    def __init__(self, directory, mode='replay', latency=0.0, bandwidth=None):
+        # latency - seconds before each replayed response starts
+        # bandwidth - bytes a second at which replayed bodies are read, or
+        # None for no limit
+        if mode not in MODES:
+            raise ValueError('Cassette mode must be one of {0}, not {1!r}'.format(', '.join(MODES), mode))
+        self.directory = directory
+        self.mode = mode
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.indexFile = os.path.join(directory, 'index.json')
+        self.index = self.loadIndex()
+        # Names used as keys for URLs that change between sessions
+        self.aliases = {}
+        self.lock = threading.Lock()
+
+    def adapter(self, transport=None):
+        # Return an adapter using the cassette, which sends requests that
+        # are not replayed using the adapter transport
+        return CassetteAdapter(self, transport or requests.adapters.HTTPAdapter())
+
+    def mount(self, session, transport=None):
+        # Send all requests made by session through the cassette
+        adapter = self.adapter(transport)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def alias(self, url, name):
+        # Record and replay requests for url under name
+        self.aliases[url] = name
+
+    def key(self, request):
+        name = self.aliases.get(request.url)
+        if name is not None:
+            return '{0} alias:{1}'.format(request.method, name)
+        return '{0} {1}'.format(request.method, request.url)
+
+    def loadIndex(self):
+        try:
+            with open(self.indexFile, 'rt') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def updateIndex(self, key, entry):
+        # Read the index again before changing it, as other processes may
+        # have recorded responses
+        with self.lock:
+            index = self.loadIndex()
+            index[key] = entry
+            os.makedirs(self.directory, exist_ok=True)
+            tmpfile = self.indexFile + '.{0}.tmp'.format(os.getpid())
+            with open(tmpfile, 'wt') as f:
+                json.dump(index, f, indent=2, sort_keys=True)
+            os.replace(tmpfile, self.indexFile)
+            self.index = index
+
+    def bodyPath(self, sha256):
+        return os.path.join(self.directory, 'bodies', sha256[:2], sha256 + '.gz')
+
+    def storeBody(self, chunks):
+        # Save the chunks of bytes compressed, and return their hash and size
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmpfile = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            path = self.bodyPath(sha256)
+            if os.path.exists(path):
+                os.unlink(tmpfile)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmpfile, path)
+        except BaseException:
+            if os.path.exists(tmpfile):
+                os.unlink(tmpfile)
+            raise
+        return sha256, size
+
+    def lookup(self, request):
+        entry = self.index.get(self.key(request))
+        if entry is not None and not os.path.exists(self.bodyPath(entry['sha256'])):
+            return None
+        return entry
+
+    def record(self, request, response):
+        # Save the response, whose body has not yet been read, and return the
+        # index entry
+        sha256, size = self.storeBody(response.raw.stream(self.chunkSize, decode_content=True))
+        response.close()
+        entry = {
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': [
+                [name, value] for name, value in response.headers.items()
+                if name.lower() not in DROPPED_HEADERS
+                ],
+            'sha256': sha256,
+            'size': size,
+            'recorded': time.time(),
+        }
+        self.updateIndex(self.key(request), entry)
+        return entry
+
+    def isNotModified(self, request, entry):
+        # True if a conditional request would get a 304 response
+        headers = dict((name.lower(), value) for name, value in entry['headers'])
+        etag = request.headers.get('If-None-Match')
+        if etag is not None:
+            return etag == headers.get('etag')
+        modified = request.headers.get('If-Modified-Since')
+        return modified is not None and modified == headers.get('last-modified')
+
+    def replay(self, adapter, request, entry, simulate=True):
+        # Return a response built from the index entry
+        import urllib3
+        from urllib3._collections import HTTPHeaderDict
+        if simulate and self.latency:
+            time.sleep(self.latency)
+        headers = HTTPHeaderDict(entry['headers'])
+        if entry['status'] == 200 and self.isNotModified(request, entry):
+            status, reason, body = 304, 'Not Modified', io.BytesIO()
+            headers['Content-Length'] = '0'
+        else:
+            status, reason = entry['status'], entry['reason']
+            body = gzip.open(self.bodyPath(entry['sha256']), 'rb')
+            headers['Content-Length'] = str(entry['size'])
+        raw = urllib3.HTTPResponse(
+            body=io.BufferedReader(ThrottledBody(body, self.bandwidth if simulate else None)),
+            headers=headers, status=status, reason=reason, preload_content=False,
+            decode_content=False, request_method=request.method
+            )
+        return adapter.transport.build_response(request, raw)
+
+
+class CassetteAdapter(requests.adapters.BaseAdapter):
+
+    def __init__(self, cassette, transport):
+        super().__init__()
+        self.cassette = cassette
+        self.transport = transport
+
+    def send(self, request, stream=False, **kwargs):
+        cassette = self.cassette
+        entry = None if cassette.mode == 'record' else cassette.lookup(request)
+        if entry is None:
+            if cassette.mode == 'replay':
+                raise CassetteMiss('{0} is not in the cassette'.format(cassette.key(request)), request=request)
+            # Ask for the complete response, so it can be replayed to requests
+            # that are not conditional
+            unconditional = request.copy()
+            for name in ('If-None-Match', 'If-Modified-Since'):
+                unconditional.headers.pop(name, None)
+            response = self.transport.send(unconditional, stream=True, **kwargs)
+            entry = cassette.record(request, response)
+            response = cassette.replay(self, request, entry, simulate=False)
+        else:
+            response = cassette.replay(self, request, entry)
+        name = cassette.aliases.get(request.url)
+        if name is not None and response.is_redirect:
+            # The redirect may also be to a URL for this run
+            location = urllib.parse.urljoin(request.url, response.headers['Location'])
+            cassette.alias(location, name + ' redirect')
+        if not stream:
+            response.content
+        return response
+
+    def close(self):
+        self.transport.close()
@@ -0,0 +1,113 @@
+'''Trace the WebDriver commands sent to a browser during a test.
+
+Every command Selenium sends to the browser, including those made through
+elements, goes through the driver's execute method.  CommandTrace replaces
+that method on the driver with one that records the command, its locator,
+how long it took, and the stage of the test it was made in.  The trace is
+written in the Chrome trace event format, which can be loaded into
+chrome://tracing or https://ui.perfetto.dev, together with the waits and
+sleeps from the test's wait log, and a summary splitting the time taken by
+the test into WebDriver commands, waits, sleeps, and harness CPU time.
+'''
+
+import json, os, time
+
+
+class CommandTrace:
+
+    def __init__(self, waitLog=None):
+        self.waitLog = waitLog if waitLog is not None else []
+        self.commands = []
+        self.stage = None
+        self.drivers = []
+        self.start = time.time()
+        self.cpuStart = time.process_time()
+
+    def install(self, driver):
+        # Trace the commands sent to driver, until uninstall is called
+        if any(d is driver for d in self.drivers):
+            return
+        execute = driver.execute
+        def tracedExecute(command, params=None):
+            start = time.time()
+            try:
+                return execute(command, params)
+            finally:
+                self.record(command, params, start, time.time() - start)
+        driver.execute = tracedExecute
+        self.drivers.append(driver)
+
+    def uninstall(self):
+        for driver in self.drivers:
+            # Remove the instance attribute, uncovering the class method
+            driver.__dict__.pop('execute', None)
+        self.drivers = []
+
+    def record(self, command, params, start, duration):
+        locator = None
+        if params:
+            if 'using' in params:
+                locator = '{0}={1}'.format(params['using'], params.get('value'))
+            elif 'id' in params:
+                locator = 'element {0}'.format(params['id'])
+        self.commands.append({
+            'command': command,
+            'locator': locator,
+            'start': start,
+            'seconds': duration,
+            'stage': self.stage,
+        })
+
+    def setStage(self, stage):
+        # Set the stage of the test that following commands are part of, and
+        # return the previous stage
+        previous, self.stage = self.stage, stage
+        return previous
+
+    def summary(self):
+        # Split the time taken so far into commands made outside waits,
+        # waits, sleeps, and other time, of which harness CPU time is part
+        elapsed = time.time() - self.start
+        waits = [r for r in self.waitLog if r['kind'] == 'wait' and 'start' in r]
+        waitTime = sum(r['seconds'] for r in waits)
+        sleepTime = sum(r['seconds'] for r in self.waitLog if r['kind'] == 'sleep')
+        commandTime = 0.0
+        for command in self.commands:
+            # Commands polling a condition are counted as part of the wait
+            if not any(w['start'] <= command['start'] < w['start'] + w['seconds'] for w in waits):
+                commandTime += command['seconds']
+        return {
+            'elapsed': elapsed,
+            'commands': len(self.commands),
+            'webdriver': commandTime,
+            'waits': waitTime,
+            'sleeps': sleepTime,
+            'cpu': time.process_time() - self.cpuStart,
+            'other': max(0.0, elapsed - commandTime - waitTime - sleepTime),
+        }
+
+    def write(self, filename, name):
+        # Write the trace in the Chrome trace event format
+        def micros(t):
+            return int((t - self.start) * 1000000)
+        pid = os.getpid()
+        events = [{
+            'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': threadName}
+            } for tid, threadName in ((1, 'webdriver'), (2, 'waits'))]
+        for command in self.commands:
+            events.append({
+                'name': command['command'], 'cat': 'webdriver', 'ph': 'X', 'pid': pid, 'tid': 1,
+                'ts': micros(command['start']), 'dur': int(command['seconds'] * 1000000),
+                'args': {'locator': command['locator'], 'stage': command['stage']},
+            })
+        for record in self.waitLog:
+            if 'start' in record:
+                events.append({
+                    'name': record['name'], 'cat': record['kind'], 'ph': 'X', 'pid': pid, 'tid': 2,
+                    'ts': micros(record['start']), 'dur': int(record['seconds'] * 1000000),
+                    'args': {'timedOut': record.get('timedOut')},
+                })
+        summary = self.summary()
+        with open(filename, 'wt') as f:
+            json.dump({'traceEvents': events, 'otherData': dict(summary, test=name)}, f)
+        return summary
@@ -0,0 +1,135 @@
+'''Create Selenium browser drivers from the browser configuration.
+
+Each browser used by the tests is described by a dict of settings, e.g.
+
+    {'backend': 'firefox', 'tag': 'ffx', 'headless': True, 'windowSize': (1024, 640)}
+
+where backend names a registered driver backend, and the other settings are:
+
+    tag - short name added to screenshot file names
+    windowSize - (width, height) of the browser window, or None to leave it
+    probe - if True, skip tests when the browser cannot be started
+    and any keyword arguments accepted by the backend (e.g. headless)
+
+browserMixin creates the class (e.g. WithFirefox) that the tests inherit
+from, to run with that browser.  New backends can be added using the
+registerBackend decorator.
+'''
+
+import json
+
+import BrowserProbe
+
+
+# Settings for the browsers that the tests are run with. config.py can
+# change these settings using the browsers dict.
+defaultBrowsers = {
+    'Firefox': {'backend': 'firefox', 'tag': 'ffx', 'windowSize': (1024, 640)},
+    'Chrome': {'backend': 'chrome', 'tag': 'chr', 'probe': True},
+}
+
+# name -> (function creating a driver, driver executable or None)
+backends = {}
+
+
+def registerBackend(name, executable=None):
+    def register(function):
+        backends[name] = (function, executable)
+        return function
+    return register
+
+
+@registerBackend('firefox', 'geckodriver')
+def firefoxDriver(headless=False):
+    from selenium import webdriver
+    options = webdriver.FirefoxOptions()
+    if headless:
+        options.add_argument('-headless')
+    return webdriver.Firefox(options=options)
+
+
+@registerBackend('chrome', 'chromedriver')
+def chromeDriver(headless=False):
+    from selenium import webdriver
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless')
+        options.add_argument('--disable-gpu')
+    return webdriver.Chrome(options=options)
+
+
+@registerBackend('remote')
+def remoteDriver(url='http://localhost:4444/wd/hub', browserName='firefox', headless=False):
+    # Use a Selenium server or grid, e.g. a local server started using
+    # java -jar selenium-server-standalone.jar
+    from selenium import webdriver
+    if browserName == 'chrome':
+        options = webdriver.ChromeOptions()
+        if headless:
+            options.add_argument('--headless')
+    else:
+        options = webdriver.FirefoxOptions()
+        if headless:
+            options.add_argument('-headless')
+    return webdriver.Remote(
+        command_executor=url, desired_capabilities=options.to_capabilities()
+        )
+
+
+def browserSettings(browsers):
+    # Return the settings for each browser, combining the defaults with any
+    # changes in browsers.  A browser set to None is disabled.
+    settings = {}
+    for name in list(defaultBrowsers) + [name for name in browsers if name not in defaultBrowsers]:
+        if name in browsers and browsers[name] is None:
+            settings[name] = None
+        else:
+            settings[name] = dict(defaultBrowsers.get(name, {}), **browsers.get(name, {}))
+    return settings
+
+
+def createDriver(settings):
+    options = dict(settings)
+    function, executable = backends[options.pop('backend')]
+    windowSize = options.pop('windowSize', None)
+    for name in ('tag', 'probe'):
+        options.pop(name, None)
+    driver = function(**options)
+    if windowSize:
+        driver.set_window_size(*windowSize)
+    return driver
+
+
+def browserMixin(name, settings, cacheFile):
+    # Return a class to mix into a test class, to run the test with the
+    # browser described by settings
+    tag = settings.get('tag', name.lower()[:3]) if settings else name.lower()[:3]
+
+    class BrowserMixin:
+
+        browserName = name
+
+        @classmethod
+        def browserUnavailable(cls):
+            if settings is None:
+                return '{0} is disabled in config'.format(name)
+            if not settings.get('probe'):
+                return None
+            function, executable = backends[settings['backend']]
+            if executable is None:
+                return None
+            def start():
+                createDriver(settings).quit()
+            return BrowserProbe.unavailableReason(
+                name, executable, start, cacheFile,
+                ' ' + json.dumps(settings, sort_keys=True)
+                )
+
+        def screenshotTag(self):
+            return tag
+
+        def getBrowser(self):
+            return createDriver(settings)
+
+    BrowserMixin.__name__ = BrowserMixin.__qualname__ = 'With' + name
+    return BrowserMixin
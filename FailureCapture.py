@@ -0,0 +1,131 @@
+'''Save the state of the browser when a test fails, for diagnosis.
+
+When a run fails, or the portal does something unexpected, the test takes a
+snapshot of the page source, a screenshot, the status timelines of its runs
+and the run log in the Advanced section of the run page, using as few
+requests to the browser as possible.  The snapshot is handed to a
+FailureCapture, which compresses and writes it on a background thread into
+a directory for the test, so the test can report its failure and the next
+test can start without waiting for the files to be written.
+
+Each item is limited to a maximum size.  Longer text is cut short, with a
+note saying so, and a larger screenshot is not kept.  The files written for
+each snapshot, and those not kept, are listed in its info file.
+'''
+
+import gzip, json, os, queue, sys, threading, time
+
+
+class FailureCapture:
+
+    def __init__(self, maxBytes=4 * 1024 * 1024):
+        # maxBytes - largest size of each item saved, before compression
+        self.maxBytes = maxBytes
+        # Unbounded, so a test never waits for earlier snapshots to be written
+        self.queue = queue.Queue()
+        self.errors = []
+        self.thread = None
+        # Names used in each directory, so repeated captures are kept
+        self.used = set()
+        self.lock = threading.Lock()
+
+    def uniqueName(self, directory, label):
+        with self.lock:
+            name = label
+            number = 1
+            while (directory, name) in self.used:
+                number += 1
+                name = '{0}-{1}'.format(label, number)
+            self.used.add((directory, name))
+            return name
+
+    def capture(self, directory, label, state=None, png=None, timelines=None):
+        # Queue a snapshot to be written to directory, with file names
+        # starting with label, and return the name of its info file.
+        # state - dict from PortalBrowser.getFailureState
+        # png - screenshot as PNG data
+        # timelines - list of WorkflowRun.exportTimeline() results
+        name = self.uniqueName(directory, label)
+        snapshot = {
+            'time': time.time(),
+            'url': state and state.get('url'),
+            'source': state and state.get('source'),
+            'runLog': state and state.get('advanced'),
+            'timelines': timelines,
+            'png': png,
+        }
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='FailureCapture', daemon=True)
+            self.thread.start()
+        self.queue.put((directory, name, snapshot))
+        return os.path.join(directory, name + '-info.json')
+
+    def run(self):
+        while True:
+            directory, name, snapshot = self.queue.get()
+            try:
+                self.write(directory, name, snapshot)
+            except Exception as exc:
+                self.errors.append('{0}: {1}'.format(os.path.join(directory, name), exc))
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        # Wait until all snapshots have been written, and raise an error if
+        # any could not be written
+        self.queue.join()
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise OSError('Cannot write failure snapshots:\n' + '\n'.join(errors))
+
+    def cap(self, text):
+        # Return text encoded, and cut short if it is too long
+        data = text.encode('utf-8', 'replace')
+        if len(data) <= self.maxBytes:
+            return data, False
+        note = '\n[Cut short: {0} bytes not kept]\n'.format(len(data) - self.maxBytes).encode('ascii')
+        return data[:self.maxBytes] + note, True
+
+    def write(self, directory, name, snapshot):
+        os.makedirs(directory, exist_ok=True)
+        info = {'url': snapshot['url'], 'time': snapshot['time'], 'files': {}, 'notKept': []}
+        items = (
+            ('page.html', snapshot['source']),
+            ('runlog.txt', None if snapshot['runLog'] is None else '\n---\n'.join(
+                text or 'None' for text in snapshot['runLog']
+                )),
+            ('timeline.json', None if snapshot['timelines'] is None else json.dumps(
+                snapshot['timelines'], indent=2
+                )),
+        )
+        for suffix, text in items:
+            if text is None:
+                continue
+            data, cut = self.cap(text)
+            filename = '{0}-{1}.gz'.format(name, suffix)
+            with gzip.open(os.path.join(directory, filename), 'wb') as f:
+                f.write(data)
+            info['files'][filename] = {'bytes': len(data), 'cutShort': cut}
+        png = snapshot['png']
+        if png is not None:
+            # PNG data is already compressed
+            if len(png) <= self.maxBytes:
+                filename = name + '-screenshot.png'
+                with open(os.path.join(directory, filename), 'wb') as f:
+                    f.write(png)
+                info['files'][filename] = {'bytes': len(png), 'cutShort': False}
+            else:
+                info['notKept'].append('screenshot ({0} bytes)'.format(len(png)))
+        with open(os.path.join(directory, name + '-info.json'), 'wt') as f:
+            json.dump(info, f, indent=2, sort_keys=True)
+
+    def report(self, stream=sys.stderr):
+        # Session cleanup: wait for the snapshots, list the directories, and
+        # then raise an error if any could not be written
+        self.queue.join()
+        directories = sorted(set(directory for directory, name in self.used))
+        if directories:
+            stream.write('Failure snapshots saved in:\n')
+            for directory in directories:
+                stream.write('  {0}\n'.format(directory))
+        self.flush()
@@ -0,0 +1,203 @@
+'''Local cache of files downloaded for use as test inputs.
+
+Tests ask for an input file by name, and get the path of a local copy.  The
+file is downloaded the first time it is needed, and kept between test
+sessions in a content-addressed store, where each file is saved under its
+SHA-256 hash, alongside a manifest recording the name, URL and hash of each
+file.  Once per session, the cached copy is checked against the server
+using a conditional request, so a changed file is downloaded again, but an
+unchanged one is not.  In offline mode, only the cached files are used, and
+the network is never touched.
+
+To run the tests offline on a machine without network access, the cache can
+be seeded with files copied from elsewhere:
+
+    python3 FixtureCache.py [-d DIR] NAME PATH [URL]
+
+or listed with
+
+    python3 FixtureCache.py [-d DIR] --list
+'''
+
+import hashlib, json, os, sys, tempfile, threading
+
+
+class FixtureError(Exception):
+    pass
+
+
+def fileDigest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FixtureCache:
+
+    chunkSize = 64 * 1024
+
+    def __init__(self, directory, offline=False, session=None):
+        self.directory = directory
+        self.offline = offline
+        self.session = session
+        self.manifestFile = os.path.join(directory, 'manifest.json')
+        # Names of the fixtures checked in this session, and their paths
+        self.checked = {}
+        self.lock = threading.Lock()
+
+    def getSession(self):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        return self.session
+
+    def loadManifest(self):
+        try:
+            with open(self.manifestFile, 'rt') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def updateManifest(self, name, entry):
+        # Read the manifest again before changing it, as other processes
+        # may have added entries
+        manifest = self.loadManifest()
+        if entry is None:
+            manifest.pop(name, None)
+        else:
+            manifest[name] = entry
+        os.makedirs(self.directory, exist_ok=True)
+        tmpfile = self.manifestFile + '.{0}.tmp'.format(os.getpid())
+        with open(tmpfile, 'wt') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmpfile, self.manifestFile)
+
+    def objectPath(self, name, sha256):
+        # Files keep their name, inside a directory named by the hash, as
+        # the file name is shown when the file is uploaded to the portal
+        return os.path.join(self.directory, 'objects', sha256, name)
+
+    def store(self, name, chunks):
+        # Save the chunks of bytes as the content of name, and return the
+        # hash and path of the stored file
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmpfile = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            path = self.objectPath(name, sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmpfile, path)
+        except BaseException:
+            os.unlink(tmpfile)
+            raise
+        return sha256, path
+
+    def isIntact(self, entry, name):
+        path = self.objectPath(name, entry['sha256'])
+        return os.path.exists(path) and fileDigest(path) == entry['sha256']
+
+    def download(self, name, url, entry=None):
+        # Download url, unless it has not changed since entry was cached,
+        # and return the new manifest entry
+        headers = {}
+        if entry and entry.get('url') == url:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('lastModified'):
+                headers['If-Modified-Since'] = entry['lastModified']
+        with self.getSession().get(url, headers=headers, stream=True) as r:
+            if r.status_code == 304:
+                return entry
+            r.raise_for_status()
+            sha256, path = self.store(name, r.iter_content(self.chunkSize))
+            return {
+                'url': url,
+                'sha256': sha256,
+                'size': os.path.getsize(path),
+                'etag': r.headers.get('ETag'),
+                'lastModified': r.headers.get('Last-Modified'),
+            }
+
+    def get(self, name, url=None):
+        # Return the path of the local copy of the file called name.  url is
+        # the URL of the file, or a function returning it, which is only
+        # called if the file needs to be downloaded and its URL is not yet
+        # known.
+        with self.lock:
+            if name in self.checked:
+                return self.checked[name]
+            entry = self.loadManifest().get(name)
+            if entry is not None and not self.isIntact(entry, name):
+                print('Cached {0} is damaged, removing it'.format(name), file=sys.stderr)
+                self.updateManifest(name, None)
+                entry = None
+            if self.offline:
+                if entry is None:
+                    raise FixtureError('{0} is not cached, and offline mode is set'.format(name))
+            else:
+                if callable(url):
+                    url = url() if entry is None or not entry.get('url') else entry['url']
+                url = url or (entry and entry.get('url'))
+                if url is None:
+                    if entry is None:
+                        raise FixtureError('{0} is not cached, and has no URL'.format(name))
+                else:
+                    try:
+                        newEntry = self.download(name, url, entry)
+                    except Exception as exc:
+                        if entry is None:
+                            raise
+                        # Use the cached copy if the server cannot be reached
+                        print('Cannot check {0}, using cached copy: {1}'.format(name, exc), file=sys.stderr)
+                    else:
+                        if newEntry is not entry:
+                            self.updateManifest(name, newEntry)
+                        entry = newEntry
+            path = self.checked[name] = self.objectPath(name, entry['sha256'])
+            return path
+
+    def seed(self, name, path, url=None):
+        # Add a local file to the cache
+        with open(path, 'rb') as f:
+            sha256, stored = self.store(name, iter(lambda: f.read(self.chunkSize), b''))
+        self.updateManifest(name, {
+            'url': url,
+            'sha256': sha256,
+            'size': os.path.getsize(stored),
+            'etag': None,
+            'lastModified': None,
+        })
+        return stored
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Add files to the test fixture cache')
+    parser.add_argument('-d', '--directory', default=os.path.join('.cache', 'fixtures'),
+        help='cache directory')
+    parser.add_argument('--list', action='store_true', help='list the cached files')
+    parser.add_argument('name', nargs='?', help='name tests use for the file')
+    parser.add_argument('path', nargs='?', help='file to add')
+    parser.add_argument('url', nargs='?', help='URL the file is downloaded from')
+    args = parser.parse_args(argv)
+    cache = FixtureCache(args.directory, offline=True)
+    if args.list:
+        for name, entry in sorted(cache.loadManifest().items()):
+            status = 'ok' if cache.isIntact(entry, name) else 'DAMAGED'
+            print('{0}  {1}  {2}  {3}'.format(entry['sha256'][:12], status, name, entry.get('url') or ''))
+        return 0
+    if not args.name or not args.path:
+        parser.error('NAME and PATH are required')
+    print(cache.seed(args.name, args.path, args.url))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,662 @@
+'''A local stand-in for the BioVeL portal, for running the harness offline.
+
+The mock portal serves the pages, element ids and links that PortalBrowser,
+PortalClient and WorkflowTest depend on: the header tabs and login box, the
+notice_flash and error_flash messages, the footer version, the workflow
+upload and run forms, and run pages with the run-info status, run-outputs,
+Advanced section and modal-interaction-dialog.  Runs do not execute
+anything.  Each run steps through a scripted sequence of statuses, with the
+time spent in each divided by a speed factor, and produces fixed output
+values (the Rconnect workflow's out value is 28364).  A delay can be added
+to every response, to model a distant portal.
+
+Start it, and point the tests at it using config.py:
+
+    python3 MockPortal.py -p 8080 --speed 10 --latency 0.05
+    # config.py
+    starturl = 'http://localhost:8080/'
+    username = 'tester'
+    password = 'secret'
+
+Any non-empty username and password are accepted.  Only uploaded workflows
+can be run, and only their output values are known, so tests of the public
+BioVeL workflows (e.g. DRW, ENM) and workflows whose interaction pages are
+checked in detail (e.g. MPM) cannot be run against the mock portal.
+'''
+
+import argparse, email.parser, email.policy, html, http.cookies, http.server, io, json, re
+import secrets, sys, threading, time, urllib.parse
+
+import TavernaList
+
+
+VERSION = 'Portal version: 1.0.0-10600'
+
+CATEGORIES = (
+    'Ecological Niche Modelling', 'Other', 'Population Modelling', 'Taxonomic Refinement'
+    )
+
+# Status of a run, and the seconds it stays in that status at speed 1
+SCHEDULE = (
+    ('Connecting to Taverna Server', 0.5),
+    ('Initializing new workflow run', 0.5),
+    ('Uploading run inputs', 0.5),
+    ('Queued', 2),
+    ('Starting run', 1),
+    ('Running', 3),
+    ('Gathering run outputs and log', 1),
+    ('Running post-run tasks', 0.5),
+)
+
+# Values of outputs, by name. Other outputs are given a made up value.
+OUTPUT_VALUES = {'out': '28364'}
+
+STOPPED = ('Finished', 'Failed', 'Cancelled')
+
+# Follows links with data-method and data-confirm attributes, as the Rails
+# JavaScript does, and shows the login box
+PAGE_SCRIPT = '''
+document.addEventListener('click', function (event) {
+    var link = event.target.closest('a[data-method], a[data-confirm], a[data-login]');
+    if (link === null) return;
+    event.preventDefault();
+    if (link.hasAttribute('data-login')) {
+        document.getElementById('login_box').style.display = 'block';
+        return;
+    }
+    if (link.dataset.confirm && !window.confirm(link.dataset.confirm)) return;
+    var method = link.dataset.method || 'get';
+    if (method === 'get') {
+        window.location = link.href;
+        return;
+    }
+    var form = document.createElement('form');
+    form.method = 'post';
+    form.action = link.href;
+    var fields = {_method: method, authenticity_token: document.querySelector('meta[name="csrf-token"]').content};
+    for (var name in fields) {
+        var input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = name;
+        input.value = fields[name];
+        form.appendChild(input);
+    }
+    document.body.appendChild(form);
+    form.submit();
+});
+'''
+
+# Updates the run page as the run status changes
+RUN_SCRIPT = '''
+(function () {
+    var url = window.location.pathname + '/status';
+    var status = document.evaluate("//div[@id='run-info']/div[1]/p[3]", document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    var shown = status.textContent;
+    var parts = {'run-links': 'links', 'run-dialog': 'dialog', 'run-outputs-container': 'outputs'};
+    var shownParts = SHOWN_PARTS;
+    function update() {
+        var request = new XMLHttpRequest();
+        request.open('GET', url);
+        request.onload = function () {
+            var run = JSON.parse(request.responseText);
+            // Only replace parts that changed, so an open interaction is kept
+            for (var id in parts) {
+                if (run[parts[id]] !== shownParts[id]) {
+                    shownParts[id] = run[parts[id]];
+                    document.getElementById(id).innerHTML = shownParts[id];
+                }
+            }
+            if ('Status: ' + run.status !== shown) {
+                shown = 'Status: ' + run.status;
+                status.textContent = shown;
+            }
+            if (!run.stopped) setTimeout(update, 250);
+        };
+        request.send();
+    }
+    setTimeout(update, 250);
+})();
+'''
+
+INTERACTION_PAGE = '''<!DOCTYPE html>
+<html><head><title>Interaction</title></head>
+<body><table><tbody>
+<tr><td><div>{title}</div></td></tr>
+<tr><td><form onsubmit="return false;"><button type="button" id="ok"><div>OK</div></button></form></td></tr>
+</tbody></table>
+<script>
+document.getElementById('ok').addEventListener('click', function () {{
+    var request = new XMLHttpRequest();
+    request.open('POST', '{url}');
+    request.onload = function () {{
+        var dialog = window.parent.document.getElementById('modal-interaction-dialog');
+        if (dialog !== null) dialog.parentNode.parentNode.removeChild(dialog.parentNode);
+    }};
+    request.send();
+}});
+</script>
+</body></html>
+'''
+
+
+class Run:
+
+    def __init__(self, number, workflow, owner, inputs, schedule, interactions):
+        self.number = number
+        self.workflow = workflow
+        self.owner = owner
+        self.inputs = inputs
+        # The statuses the run goes through. Waiting for user input lasts
+        # until the interaction is answered.
+        self.schedule = list(schedule)
+        running = [status for status, seconds in self.schedule].index('Running')
+        for i in range(interactions):
+            self.schedule[running + 1:running + 1] = [('Waiting for user input', None), ('Running', 1)]
+        self.phase = 0
+        self.phaseStart = time.time()
+        self.cancelled = False
+
+    def getStatus(self, speed):
+        # Move on through the schedule, and return the current status
+        if self.cancelled:
+            return 'Cancelled'
+        now = time.time()
+        while self.phase < len(self.schedule):
+            status, seconds = self.schedule[self.phase]
+            if seconds is None or now - self.phaseStart < seconds / speed:
+                return status
+            self.phaseStart += seconds / speed
+            self.phase += 1
+        return 'Finished'
+
+    def answer(self):
+        if self.phase < len(self.schedule) and self.schedule[self.phase][1] is None:
+            self.phase += 1
+            self.phaseStart = time.time()
+
+
+class MockPortal:
+
+    def __init__(self, speed=1.0, latency=0.0, interactions=0, schedule=SCHEDULE):
+        self.speed = speed
+        self.latency = latency
+        self.interactions = interactions
+        self.schedule = schedule
+        self.workflows = {}
+        self.runs = {}
+        self.sessions = {}
+        self.nextId = 1
+        self.lock = threading.RLock()
+
+    def newId(self):
+        with self.lock:
+            number = self.nextId
+            self.nextId += 1
+            return number
+
+    def serve(self, port=0, host='localhost'):
+        # Start serving on a background thread, and return the server. The
+        # portal URL is 'http://{0}:{1}/'.format(*server.server_address)
+        portal = self
+
+        class Handler(PortalHandler):
+            pass
+        Handler.portal = portal
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, name='MockPortal', daemon=True)
+        thread.start()
+        return server
+
+
+class PortalHandler(http.server.BaseHTTPRequestHandler):
+
+    portal = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    # Sessions and responses
+
+    def getSession(self):
+        cookies = http.cookies.SimpleCookie(self.headers.get('Cookie', ''))
+        token = cookies['_portal_session'].value if '_portal_session' in cookies else None
+        # Flash messages are kept in a cookie, as in the Rails cookie store,
+        # so clients sharing a session see only their own messages
+        self.flash = {}
+        if '_portal_flash' in cookies:
+            try:
+                self.flash = json.loads(urllib.parse.unquote(cookies['_portal_flash'].value))
+            except ValueError:
+                pass
+        with self.portal.lock:
+            session = self.portal.sessions.get(token)
+            if session is None:
+                token = secrets.token_hex(16)
+                session = self.portal.sessions[token] = {
+                    'token': token, 'user': None, 'csrf': secrets.token_hex(16), 'new': True,
+                    }
+        return session
+
+    def send(self, status, body, contentType='text/html; charset=utf-8', headers=()):
+        if self.portal.latency:
+            time.sleep(self.portal.latency)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        if self.session.pop('new', False):
+            self.send_header('Set-Cookie', '_portal_session={0}; Path=/; HttpOnly'.format(self.session['token']))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def redirect(self, path, notice=None, error=None):
+        headers = [('Location', urllib.parse.urljoin(self.url(), path))]
+        flash = {key: value for key, value in (('notice', notice), ('error', error)) if value}
+        if flash:
+            headers.append(('Set-Cookie', '_portal_flash={0}; Path=/'.format(
+                urllib.parse.quote(json.dumps(flash))
+                )))
+        self.send(303, '', headers=headers)
+
+    def url(self):
+        return 'http://{0}/'.format(self.headers.get('Host', '{0}:{1}'.format(*self.server.server_address)))
+
+    def page(self, title, content):
+        session = self.session
+        flash = ''
+        headers = []
+        if self.flash.get('notice'):
+            flash += '<div id="notice_flash">{0}</div>'.format(html.escape(self.flash['notice']))
+        if self.flash.get('error'):
+            flash += '<div id="error_flash">{0}</div>'.format(html.escape(self.flash['error']))
+        if self.flash:
+            # Show the messages once
+            headers.append(('Set-Cookie', '_portal_flash=; Path=/; Max-Age=0'))
+        if session['user']:
+            account = '<a href="/session" data-method="delete">Log out</a> {0}'.format(
+                html.escape(session['user'])
+                )
+        else:
+            account = '''<a href="/session/new" data-login="1">Log in</a>
+<div id="login_box" style="display: none">
+<form action="/session" method="post">
+<input type="hidden" name="authenticity_token" value="{0}">
+<input type="text" id="login" name="login">
+<input type="password" id="password" name="password">
+<input type="submit" id="login_button" name="commit" value="Log in">
+</form>
+</div>'''.format(session['csrf'])
+        self.send(200, '''<!DOCTYPE html>
+<html><head><title>BioVeL Portal - {title}</title>
+<meta name="csrf-param" content="authenticity_token">
+<meta name="csrf-token" content="{csrf}">
+</head>
+<body id="body">
+<div id="header">
+<a href="/">Home</a> <a href="/workflows">Workflows</a> <a href="/runs">Runs</a>
+{account}
+</div>
+{flash}
+<div id="content">
+{content}
+</div>
+<div id="ft"><div><p>{version} - BioVeL mock portal</p></div></div>
+<script>{script}</script>
+</body></html>
+'''.format(
+            title=html.escape(title), csrf=session['csrf'], account=account, flash=flash,
+            content=content, version=VERSION, script=PAGE_SCRIPT
+            ), headers=headers)
+
+    def readForm(self):
+        # Return the form fields, and the uploaded files as (filename, data)
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        contentType = self.headers.get('Content-Type', '')
+        fields = {}
+        files = {}
+        if contentType.startswith('multipart/form-data'):
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                b'Content-Type: ' + contentType.encode('latin-1') + b'\r\n\r\n' + body
+                )
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                filename = part.get_filename()
+                data = part.get_payload(decode=True) or b''
+                if filename is not None:
+                    if filename:
+                        files[name] = (filename, data)
+                else:
+                    fields[name] = data.decode('utf-8')
+        else:
+            for name, value in urllib.parse.parse_qsl(body.decode('utf-8'), keep_blank_values=True):
+                fields[name] = value
+        return fields, files
+
+    # Dispatch
+
+    routes = (
+        ('GET', r'/', 'home'),
+        ('GET', r'/session/new', 'home'),
+        ('POST', r'/session', 'signIn'),
+        ('GET', r'/workflows', 'workflows'),
+        ('GET', r'/workflows/new', 'newWorkflow'),
+        ('POST', r'/workflows', 'createWorkflow'),
+        ('GET', r'/workflows/(\d+)', 'workflow'),
+        ('GET', r'/workflows/(\d+)/edit', 'editWorkflow'),
+        ('POST', r'/workflows/(\d+)', 'updateWorkflow'),
+        ('GET', r'/workflows/(\d+)/runs/new', 'newRun'),
+        ('POST', r'/workflows/(\d+)/runs', 'createRun'),
+        ('GET', r'/runs', 'runs'),
+        ('GET', r'/runs/(\d+)', 'run'),
+        ('POST', r'/runs/(\d+)', 'updateRun'),
+        ('GET', r'/runs/(\d+)/status', 'runStatus'),
+        ('POST', r'/runs/(\d+)/cancel', 'cancelRun'),
+        ('GET', r'/runs/(\d+)/interaction', 'interaction'),
+        ('POST', r'/runs/(\d+)/interaction', 'answerInteraction'),
+        ('GET', r'/runs/(\d+)/outputs/([^/]+)', 'output'),
+    )
+
+    def dispatch(self):
+        self.session = self.getSession()
+        path = urllib.parse.urlsplit(self.path).path.rstrip('/') or '/'
+        # HEAD requests are answered by the GET pages, which send leaves out
+        command = 'GET' if self.command == 'HEAD' else self.command
+        for method, pattern, name in self.routes:
+            match = re.fullmatch(pattern, path)
+            if match and method == command:
+                return getattr(self, name)(*match.groups())
+        self.send(404, 'Not found', 'text/plain')
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_HEAD(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    # Pages
+
+    def home(self):
+        self.page('Home', '<h1>Welcome to the BioVeL Portal</h1>')
+
+    def signIn(self):
+        fields, files = self.readForm()
+        if fields.get('_method') == 'delete':
+            self.session['user'] = None
+            return self.redirect('/', notice='Logged out successfully.')
+        if fields.get('login') and fields.get('password'):
+            self.session['user'] = fields['login']
+            return self.redirect('/', notice='Logged in successfully.')
+        self.redirect('/', error='Invalid username or password.')
+
+    def getWorkflow(self, number):
+        workflow = self.portal.workflows.get(int(number))
+        if workflow is None:
+            self.redirect('/workflows', error='Workflow does not exist')
+        return workflow
+
+    def workflows(self):
+        items = ''.join(
+            '<li><a href="/workflows/{0}">{1}</a></li>'.format(number, html.escape(w['name']))
+            for number, w in sorted(self.portal.workflows.items())
+            if w['owner'] == self.session['user']
+            )
+        self.page('Workflows', '<a href="/workflows/new">Upload a workflow</a><ul>{0}</ul>'.format(items))
+
+    def newWorkflow(self):
+        options = ''.join('<option value="{0}">{1}</option>'.format(i, html.escape(c)) for i, c in enumerate(CATEGORIES))
+        self.page('Upload a workflow', '''
+<form action="/workflows" method="post" enctype="multipart/form-data">
+<input type="hidden" name="authenticity_token" value="{0}">
+<input type="file" id="workflow_data" name="workflow[data]">
+<select id="workflow_category_id" name="workflow[category_id]">{1}</select>
+<input type="radio" id="sharing_scope_0" name="sharing[scope]" value="0">
+<input type="radio" id="sharing_scope_4" name="sharing[scope]" value="4" checked>
+<input type="submit" id="workflow_submit_btn" name="commit" value="Next">
+</form>'''.format(self.session['csrf'], options))
+
+    def createWorkflow(self):
+        fields, files = self.readForm()
+        if 'workflow[data]' not in files:
+            return self.redirect('/workflows/new', error='No workflow file')
+        filename, data = files['workflow[data]']
+        try:
+            inputs = TavernaList.inputDepths(io.BytesIO(data))
+        except Exception:
+            return self.redirect('/workflows/new', error='Not a Taverna 2 workflow')
+        number = self.portal.newId()
+        self.portal.workflows[number] = {
+            'name': filename.rsplit('.', 1)[0],
+            'category': CATEGORIES[int(fields.get('workflow[category_id]', 0))],
+            'private': fields.get('sharing[scope]') == '0',
+            'owner': self.session['user'],
+            'inputs': inputs,
+            'outputs': outputNames(data),
+        }
+        self.redirect('/workflows/{0}/edit'.format(number), notice='Workflow was successfully uploaded and saved.')
+
+    def workflow(self, number):
+        workflow = self.getWorkflow(number)
+        if workflow:
+            self.page(workflow['name'], '''<h1>{0}</h1><p>{1}</p>
+<a href="/workflows/{2}/runs/new">Run workflow</a>
+<a href="/workflows/{2}/edit">Manage workflow</a>'''.format(
+                html.escape(workflow['name']), html.escape(workflow['category']), number
+                ))
+
+    def editWorkflow(self, number):
+        workflow = self.getWorkflow(number)
+        if workflow:
+            self.page('Manage ' + workflow['name'], '''
+<form action="/workflows/{0}" method="post">
+<input type="hidden" name="authenticity_token" value="{1}">
+<input type="text" name="workflow[title]" value="{2}">
+<input type="submit" name="commit" value="Save">
+</form>
+<a href="/workflows/{0}" data-method="delete" data-confirm="Are you sure?">Delete workflow</a>'''.format(
+                number, self.session['csrf'], html.escape(workflow['name'])
+                ))
+
+    def updateWorkflow(self, number):
+        fields, files = self.readForm()
+        workflow = self.getWorkflow(number)
+        if workflow:
+            if fields.get('_method') == 'delete':
+                del self.portal.workflows[int(number)]
+                self.redirect('/workflows', notice='Workflow was successfully deleted.')
+            else:
+                workflow['name'] = fields.get('workflow[title]', workflow['name'])
+                self.redirect('/workflows/{0}'.format(number), notice='Workflow was successfully updated.')
+
+    def newRun(self, number):
+        workflow = self.getWorkflow(number)
+        if workflow:
+            inputs = ''.join('''<div data-input-name="{0}"><label>{0}</label>
+<textarea name="inputs[{0}]"></textarea>
+<input type="file" name="files[{0}]"></div>'''.format(html.escape(name)) for name in workflow['inputs'])
+            self.page('Run ' + workflow['name'], '''
+<form action="/workflows/{0}/runs" method="post" enctype="multipart/form-data">
+<input type="hidden" name="authenticity_token" value="{1}">
+<div class="workflow_input">{2}</div>
+<input type="submit" name="commit" value="Start Run">
+</form>'''.format(number, self.session['csrf'], inputs))
+
+    def createRun(self, number):
+        fields, files = self.readForm()
+        workflow = self.getWorkflow(number)
+        if workflow:
+            inputs = {}
+            for name in workflow['inputs']:
+                if 'files[{0}]'.format(name) in files:
+                    inputs[name] = files['files[{0}]'.format(name)][0]
+                else:
+                    inputs[name] = fields.get('inputs[{0}]'.format(name), '')
+            runNumber = self.portal.newId()
+            self.portal.runs[runNumber] = Run(
+                runNumber, workflow, self.session['user'], inputs,
+                self.portal.schedule, self.portal.interactions
+                )
+            self.redirect('/runs/{0}'.format(runNumber), notice='Run was successfully created.')
+
+    def getRun(self, number):
+        run = self.portal.runs.get(int(number))
+        if run is None:
+            self.redirect('/runs', error='Run does not exist')
+        return run
+
+    def runs(self):
+        items = ''.join(
+            '<li><a href="/runs/{0}">{1}</a></li>'.format(number, html.escape(run.workflow['name']))
+            for number, run in sorted(self.portal.runs.items())
+            if run.owner == self.session['user']
+            )
+        self.page('Runs', '<ul>{0}</ul>'.format(items))
+
+    def runParts(self, run):
+        # Return the status, the run links, the interaction dialog and the
+        # outputs of a run page
+        status = run.getStatus(self.portal.speed)
+        if status in STOPPED:
+            links = '<a href="/runs/{0}" data-method="delete" data-confirm="Are you sure?">Delete</a>'
+        else:
+            links = '<a href="/runs/{0}/cancel" data-method="post" data-confirm="Are you sure?">Cancel</a>'
+        dialog = ''
+        if status == 'Waiting for user input':
+            dialog = '''<div class="ui-dialog" style="width: 600px; height: 400px">
+<a class="ui-dialog-titlebar-close" href="#">close</a>
+<div id="modal-interaction-dialog"><iframe src="/runs/{0}/interaction" width="580" height="360"></iframe></div>
+</div>'''
+        outputs = ''
+        if status == 'Finished':
+            outputs = '<div id="run-outputs">{0}</div>'.format(''.join('''<div class="output">
+<a id="{1}"></a><span class="name">{1}</span> <span class="mime_type">(text/plain)</span>
+<a href="/runs/{0}/outputs/{2}">Download</a></div>'''.format(
+                run.number, html.escape(name), urllib.parse.quote(name)
+                ) for name in run.workflow['outputs']))
+        return status, links.format(run.number), dialog.format(run.number), outputs
+
+    def run(self, number):
+        run = self.getRun(number)
+        if run:
+            status, links, dialog, outputs = self.runParts(run)
+            inputs = ''.join('<li>{0}: {1}</li>'.format(html.escape(name), html.escape(value))
+                for name, value in run.inputs.items())
+            self.page('Run', '''
+<div id="run-info"><div>
+<p>Run of {0}</p>
+<p>Started by {1}</p>
+<p>Status: {2}</p>
+</div></div>
+<div id="run-links">{3}</div>
+<div id="run-dialog">{4}</div>
+<div id="run-outputs-container">{5}</div>
+<ul>{6}</ul>
+<div id="advanced"><span class="foldTitle">Advanced</span>
+<div class="foldContent" style="display: none">
+<p>Taverna Server run: mock-{7}</p>
+<p>Run log: mock run, no log</p>
+</div></div>
+<script>{8}</script>'''.format(
+                html.escape(run.workflow['name']), html.escape(run.owner or 'Guest'), status,
+                links, dialog, outputs, inputs, run.number, RUN_SCRIPT.replace('SHOWN_PARTS', json.dumps({
+                    'run-links': links, 'run-dialog': dialog, 'run-outputs-container': outputs
+                    }))
+                ))
+
+    def runStatus(self, number):
+        run = self.portal.runs.get(int(number))
+        if run is None:
+            return self.send(404, 'Not found', 'text/plain')
+        status, links, dialog, outputs = self.runParts(run)
+        self.send(200, json.dumps({
+            'status': status, 'stopped': status in STOPPED, 'links': links,
+            'dialog': dialog, 'outputs': outputs,
+            }), 'application/json')
+
+    def cancelRun(self, number):
+        self.readForm()
+        run = self.getRun(number)
+        if run:
+            if run.getStatus(self.portal.speed) not in STOPPED:
+                run.cancelled = True
+            self.redirect('/runs/{0}'.format(number), notice='Run was cancelled.')
+
+    def updateRun(self, number):
+        fields, files = self.readForm()
+        run = self.getRun(number)
+        if run:
+            if fields.get('_method') == 'delete':
+                del self.portal.runs[int(number)]
+                self.redirect('/runs', notice='Run was deleted.')
+            else:
+                self.redirect('/runs/{0}'.format(number))
+
+    def interaction(self, number):
+        run = self.getRun(number)
+        if run:
+            self.send(200, INTERACTION_PAGE.format(
+                title='Mock interaction', url='/runs/{0}/interaction'.format(number)
+                ))
+
+    def answerInteraction(self, number):
+        self.readForm()
+        run = self.portal.runs.get(int(number))
+        if run is None:
+            return self.send(404, 'Not found', 'text/plain')
+        run.answer()
+        self.send(200, 'OK', 'text/plain')
+
+    def output(self, number, name):
+        run = self.getRun(number)
+        if run:
+            name = urllib.parse.unquote(name)
+            if name not in run.workflow['outputs']:
+                return self.send(404, 'Not found', 'text/plain')
+            value = OUTPUT_VALUES.get(name, 'Value of {0}'.format(name))
+            self.send(200, value, 'text/plain; charset=utf-8')
+
+
+def outputNames(data):
+    # Return the names of the output ports of a workflow file
+    import xml.etree.ElementTree as ET
+    ns = {'t': 'http://taverna.sf.net/2008/xml/t2flow'}
+    names = []
+    for dataflow in ET.parse(io.BytesIO(data)).getroot().findall('t:dataflow', ns):
+        if dataflow.get('role') == 'top':
+            for port in dataflow.findall('t:outputPorts/t:port', ns):
+                names.append(port.findtext('t:name', namespaces=ns))
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a mock BioVeL portal')
+    parser.add_argument('-p', '--port', type=int, default=8080, help='port to listen on')
+    parser.add_argument('--host', default='localhost', help='address to listen on')
+    parser.add_argument('--speed', type=float, default=1.0,
+        help='how many times faster than usual runs move through their statuses')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each response')
+    parser.add_argument('--interactions', type=int, default=0,
+        help='number of interactions in each run')
+    args = parser.parse_args(argv)
+    portal = MockPortal(args.speed, args.latency, args.interactions)
+    server = portal.serve(args.port, args.host)
+    print('Mock portal at http://{0}:{1}/'.format(*server.server_address), flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+'''Run the portal tests in parallel worker processes.
+
+Most of the time taken by a workflow test is spent waiting for the portal to
+run the workflow, so running the test classes side by side in separate
+processes reduces the time for a full pass to roughly that of the slowest
+workflow.  Each worker process uses its own browsers and writes artifacts
+into its own directory.  The results of all workers are merged into a single
+report.
+
+Usage (from the top-level directory):
+
+    python3 ParallelRunner.py [-j WORKERS] [-p PATTERN] [-o DIR] [NAME ...]
+
+NAME can be a module, a test class or a test method, as accepted by
+`python3 -m unittest`.  If no names are given, tests are discovered in the
+same way as `python3 -m unittest discover`.
+'''
+
+import argparse, json, multiprocessing, multiprocessing.util, os, sys, time, unittest
+
+
+REPORT_FILE = 'report.json'
+
+
+def iterTests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from iterTests(test)
+        else:
+            yield test
+
+
+def collectUnits(names, pattern):
+    # Return the tests that failed to load, and the names of the units of
+    # work to hand out to the workers, in discovery order.  The unit is
+    # normally a whole TestCase class, so that class-level fixtures are only
+    # set up once, in a single process.  Explicitly named test methods are
+    # run on their own.
+    loader = unittest.TestLoader()
+    if names:
+        suite = loader.loadTestsFromNames(names)
+    else:
+        suite = loader.discover('.', pattern)
+    failed = []
+    units = []
+    for test in iterTests(suite):
+        if isinstance(test, unittest.loader._FailedTest):
+            failed.append(test)
+            continue
+        if test.id() in names:
+            name = test.id()
+        else:
+            cls = test.__class__
+            name = '{0}.{1}'.format(cls.__module__, cls.__qualname__)
+        if name not in units:
+            units.append(name)
+    return failed, units
+
+
+def previousDurations(outputDir):
+    # Use the durations from the last run to start the slowest classes first
+    durations = {}
+    try:
+        with open(os.path.join(outputDir, REPORT_FILE), 'rt') as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return durations
+    for record in report.get('tests', []):
+        unit = record['unit']
+        durations[unit] = durations.get(unit, 0) + record['duration']
+    return durations
+
+
+class RecordingResult(unittest.TestResult):
+    '''Test result that keeps a picklable record of each test outcome.'''
+
+    def __init__(self, unit, workerId):
+        super().__init__()
+        self.unit = unit
+        self.workerId = workerId
+        self.records = []
+        self.started = {}
+
+    def startTest(self, test):
+        super().startTest(test)
+        self.started[test.id()] = time.time()
+
+    def record(self, test, outcome, details=None):
+        started = self.started.pop(test.id(), None)
+        self.records.append({
+            'test': test.id(),
+            'unit': self.unit,
+            'description': str(test),
+            'outcome': outcome,
+            'details': details,
+            'duration': time.time() - started if started else 0.0,
+            'worker': self.workerId,
+            })
+
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self.record(test, 'success')
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self.record(test, 'failure', self.failures[-1][1])
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        self.record(test, 'error', self.errors[-1][1])
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self.record(test, 'skipped', reason)
+
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self.record(test, 'expectedFailure')
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self.record(test, 'unexpectedSuccess')
+
+
+# Worker process state, set by initWorker
+workerId = None
+workerDir = None
+
+
+def initWorker(workerIds, outputDir):
+    global workerId, workerDir
+    workerId = workerIds.get()
+    workerDir = os.path.join(outputDir, 'worker-{0}'.format(workerId))
+    os.makedirs(workerDir, exist_ok=True)
+    # Keep the output of each worker separate, rather than interleaving it
+    # on the console.
+    log = open(os.path.join(workerDir, 'output.txt'), 'wt', buffering=1)
+    sys.stdout = sys.stderr = log
+    import BaseTest
+    BaseTest.artifactBase = workerDir
+    BaseTest.workerId = workerId
+    # Pool workers exit without calling atexit functions, so quit any pooled
+    # browsers using a multiprocessing finalizer instead.
+    multiprocessing.util.Finalize(None, BaseTest.doSessionCleanups, exitpriority=10)
+
+
+def runUnit(name):
+    print('=== {0}'.format(name), flush=True)
+    result = RecordingResult(name, workerId)
+    unittest.defaultTestLoader.loadTestsFromName(name).run(result)
+    return result.records
+
+
+def printReport(records, elapsed, stream):
+    problems = [r for r in records if r['outcome'] in ('failure', 'error')]
+    for record in problems:
+        stream.write('=' * 70 + '\n')
+        stream.write('{0}: {1} [worker {2}]\n'.format(
+            record['outcome'].upper(), record['description'], record['worker']
+            ))
+        stream.write('-' * 70 + '\n')
+        stream.write(record['details'] + '\n')
+    stream.write('-' * 70 + '\n')
+    stream.write('Ran {0} test{1} in {2:.3f}s\n\n'.format(
+        len(records), '' if len(records) == 1 else 's', elapsed
+        ))
+    counts = {}
+    for record in records:
+        counts[record['outcome']] = counts.get(record['outcome'], 0) + 1
+    infos = []
+    for outcome, label in (
+            ('failure', 'failures'), ('error', 'errors'), ('skipped', 'skipped'),
+            ('expectedFailure', 'expected failures'),
+            ('unexpectedSuccess', 'unexpected successes')
+            ):
+        if counts.get(outcome):
+            infos.append('{0}={1}'.format(label, counts[outcome]))
+    status = 'FAILED' if problems else 'OK'
+    if infos:
+        stream.write('{0} ({1})\n'.format(status, ', '.join(infos)))
+    else:
+        stream.write(status + '\n')
+    return not problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run portal tests in parallel')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 2,
+        help='number of worker processes')
+    parser.add_argument('-p', '--pattern', default='test*.py',
+        help='pattern to match test files when discovering tests')
+    parser.add_argument('-o', '--output', default='artifacts',
+        help='directory for worker artifacts and the merged report')
+    parser.add_argument('names', nargs='*', help='tests to run')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    failed, units = collectUnits(args.names, args.pattern)
+    durations = previousDurations(args.output)
+    units.sort(key=lambda name: durations.get(name, float('inf')), reverse=True)
+    workers = max(1, min(args.workers, len(units)))
+
+    # Use fresh interpreters, so workers do not share any browser state
+    context = multiprocessing.get_context('spawn')
+    workerIds = context.Queue()
+    for i in range(workers):
+        workerIds.put(i)
+
+    start = time.time()
+    # Tests that could not be loaded only need to report their import error
+    result = RecordingResult(None, None)
+    unittest.TestSuite(failed).run(result)
+    records = result.records
+    with context.Pool(workers, initWorker, (workerIds, args.output)) as pool:
+        for unitRecords in pool.imap_unordered(runUnit, units):
+            for record in unitRecords:
+                sys.stderr.write('{0} ... {1}\n'.format(record['description'], record['outcome']))
+            records.extend(unitRecords)
+        # Leaving the with block terminates the workers, which would skip
+        # their session cleanups, so let them exit normally first
+        pool.close()
+        pool.join()
+    elapsed = time.time() - start
+
+    records.sort(key=lambda record: record['test'])
+    with open(os.path.join(args.output, REPORT_FILE), 'wt') as f:
+        json.dump({'elapsed': elapsed, 'workers': workers, 'tests': records}, f, indent=2)
+    ok = printReport(records, elapsed, sys.stderr)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,6 @@
 import re, time, urllib.parse, urllib.request
 
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
 from selenium.webdriver import ActionChains
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -12,10 +12,263 @@ class UnexpectedRunStatusException(Exception):
     pass
 
 
+RUN_STATUS_XPATH = "//div[@id='run-info']/div[1]/p[3]"
+
+# Wait for the text of the run status element to change from arguments[0],
+# for up to arguments[2] seconds. Calls back with the list of new status texts
+# seen, which is empty if the status did not change, or null if the status
+# element cannot be found. The whole run-info element is observed, in case
+# the status element is replaced, rather than updated.
+OBSERVE_RUN_STATUS_SCRIPT = '''
+var last = arguments[0], xpath = arguments[1], timeout = arguments[2];
+var callback = arguments[arguments.length - 1];
+var seen = [], done = false, observer = null, timer = null;
+function statusText() {
+    var element = document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    return element === null ? null : element.innerText.trim();
+}
+function record() {
+    var text = statusText();
+    if (text !== null && text !== last) {
+        seen.push(text);
+        last = text;
+    }
+}
+function finish(result) {
+    if (!done) {
+        done = true;
+        if (observer !== null) observer.disconnect();
+        if (timer !== null) clearTimeout(timer);
+        callback(result);
+    }
+}
+var root = document.getElementById('run-info');
+if (root === null || statusText() === null) {
+    finish(null);
+    return;
+}
+record();
+if (seen.length) {
+    finish(seen);
+    return;
+}
+observer = new MutationObserver(function () {
+    record();
+    if (seen.length) {
+        // Collect any further changes made by the same update
+        setTimeout(function () { record(); finish(seen); }, 0);
+    }
+});
+observer.observe(root, {childList: true, subtree: true, characterData: true});
+timer = setTimeout(function () { finish(seen); }, timeout * 1000);
+'''
+
+
+# Return the URL of the run page, and the name, MIME type text, and download
+# link of each output in the run-outputs element, or null if there is no
+# run-outputs element. Values that are not found are null.
+RUN_OUTPUTS_SCRIPT = '''
+var runOutputs = document.getElementById('run-outputs');
+if (runOutputs === null) return null;
+function find(xpath, context) {
+    return document.evaluate(xpath, context, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+var outputs = [];
+var divs = document.evaluate('.//div[@class="output"]', runOutputs, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (var i = 0; i < divs.snapshotLength; i++) {
+    var div = divs.snapshotItem(i);
+    var anchor = find('./a[@id]', div);
+    var mimeType = find('.//span[@class="mime_type"]', div);
+    var link = find('.//a[@href]', div);
+    outputs.push({
+        name: anchor && anchor.getAttribute('id'),
+        mimeType: mimeType && mimeType.innerText.trim(),
+        href: link && link.getAttribute('href')
+    });
+}
+return {url: window.location.href, outputs: outputs};
+'''
+
+# Open the Advanced section of the run page, and return the text of each
+# element in it, or null if there is no Advanced section. Text is read even
+# if the section is still hidden.
+ADVANCED_SECTION_SCRIPT = '''
+var advanced = document.getElementById('advanced');
+if (advanced === null) return null;
+var title = document.evaluate('.//*[@class="foldTitle"]', advanced, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (title !== null) title.click();
+var texts = [];
+var elements = document.evaluate('.//div[@class="foldContent"]/*', advanced, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (var i = 0; i < elements.snapshotLength; i++) {
+    texts.push(elements.snapshotItem(i).innerText.trim());
+}
+return texts;
+'''
+
+# Return the URL and source of the page, and the Advanced section texts as
+# returned by ADVANCED_SECTION_SCRIPT, for a failure report
+FAILURE_STATE_SCRIPT = '''
+var advanced = (function () {
+''' + ADVANCED_SECTION_SCRIPT + '''
+})();
+return {url: window.location.href, source: document.documentElement.outerHTML, advanced: advanced};
+'''
+
+# Set the value of a form control, firing the events that typing a new value
+# would fire, and return the resulting value
+SET_VALUE_SCRIPT = '''
+var element = arguments[0];
+element.focus();
+element.value = arguments[1];
+element.dispatchEvent(new Event('input', {bubbles: true}));
+element.dispatchEvent(new Event('change', {bubbles: true}));
+return element.value;
+'''
+
+# True when the page has loaded, and there are no jQuery requests in progress
+AJAX_IDLE_SCRIPT = '''
+if (document.readyState !== 'complete') return false;
+return !window.jQuery || window.jQuery.active === 0;
+'''
+
+# True when every displayed OpenLayers map tile has loaded (or failed to load)
+TILES_LOADED_SCRIPT = '''
+var tiles = document.querySelectorAll('img.olTileImage');
+for (var i = 0; i < tiles.length; i++) {
+    if (tiles[i].offsetParent !== null && !tiles[i].complete) return false;
+}
+return document.readyState === 'complete';
+'''
+
+# Return the number of jQuery requests completed on the page since the first
+# call, or null if the page does not use jQuery
+AJAX_COUNT_SCRIPT = '''
+if (!window.jQuery) return null;
+if (window.portalTestAjaxCount === undefined) {
+    window.portalTestAjaxCount = 0;
+    window.jQuery(document).ajaxComplete(function () { window.portalTestAjaxCount++; });
+}
+return window.portalTestAjaxCount;
+'''
+
+# Return the sources of the OpenLayers map tiles on the page
+TILE_SOURCES_SCRIPT = '''
+return Array.prototype.map.call(document.querySelectorAll('img.olTileImage'), function (tile) {
+    return tile.src;
+});
+'''
+
+# True when a displayed map tile has a source not in the list arguments[0],
+# and every displayed tile has loaded
+NEW_TILES_LOADED_SCRIPT = '''
+var previous = arguments[0];
+var tiles = document.querySelectorAll('img.olTileImage');
+var added = false;
+for (var i = 0; i < tiles.length; i++) {
+    if (tiles[i].offsetParent === null) continue;
+    if (!tiles[i].complete) return false;
+    if (previous.indexOf(tiles[i].src) < 0) added = true;
+}
+return added;
+'''
+
+# Return the number of polygons drawn by OpenLayers vector layers, whose
+# elements are named after the geometry (OpenLayers.Geometry.Polygon_N in
+# OpenLayers 2.10, OpenLayers_Geometry_Polygon_N in later versions)
+POLYGON_COUNT_SCRIPT = '''
+return document.querySelectorAll(
+    '[id^="OpenLayers.Geometry.Polygon"], [id^="OpenLayers_Geometry_Polygon"]'
+    ).length;
+'''
+
+# True when the Google Refine data table has rows, and no requests to update
+# it are in progress
+REFINE_GRID_SCRIPT = '''
+if (document.querySelectorAll('#view-panel table.data-table tr').length === 0) return false;
+return !window.jQuery || window.jQuery.active === 0;
+'''
+
+
+def scriptCondition(script):
+    def condition(driver):
+        return driver.execute_script(script)
+    return condition
+
+
+class AccountedWait(WebDriverWait):
+    '''WebDriverWait that records how long each wait took in a wait log.'''
+
+    def __init__(self, driver, timeout, *args, waitLog=None, name=None, **kw):
+        super().__init__(driver, timeout, *args, **kw)
+        self.waitLog = waitLog
+        self.name = name
+
+    def record(self, method, start, timedOut):
+        if self.waitLog is not None:
+            self.waitLog.append({
+                'kind': 'wait',
+                'name': self.name or getattr(method, '__name__', type(method).__name__),
+                'start': start,
+                'seconds': time.time() - start,
+                'timeout': self._timeout,
+                'timedOut': timedOut,
+            })
+
+    def until(self, method, message=''):
+        start = time.time()
+        try:
+            result = super().until(method, message)
+        except TimeoutException:
+            self.record(method, start, True)
+            raise
+        self.record(method, start, False)
+        return result
+
+    def until_not(self, method, message=''):
+        start = time.time()
+        try:
+            result = super().until_not(method, message)
+        except TimeoutException:
+            self.record(method, start, True)
+            raise
+        self.record(method, start, False)
+        return result
+
+
+class PortalCapabilities:
+    '''Differences in behaviour between versions of the portal.'''
+
+    def __init__(self, version):
+        self.version = version
+        # A closed interaction page is removed from the DOM
+        self.interactionDetaches = version >= 10584
+        # The flash error is not shown on the page of a deleted run
+        self.deleteFlashMissing = version == 10550
+
+
+# Capabilities of each portal, by URL, found once per session
+_capabilities = {}
+
+
 class PortalBrowser:
 
-    def __init__(self, browser, url):
+    def __init__(self, browser, url, observeStatus=True, typeInputs=False, waitLog=None, trace=None):
+        # If observeStatus is True, watchRunStatus waits for the browser to
+        # report a status change, rather than polling the status element.
+        # If typeInputs is True, workflow input values are typed key by key,
+        # rather than set directly.
+        # Each wait and sleep is recorded in the list waitLog, and if trace
+        # is a CommandTrace, each command sent to the browser is recorded.
         self.browser = browser
+        self.waitLog = [] if waitLog is None else waitLog
+        self.trace = trace
+        # If set to a list, each new run status seen is added to it
+        self.statusTimeline = None
+        if trace is not None:
+            trace.install(browser)
+        self.url = url
+        self.observeStatus = observeStatus
+        self.typeInputs = typeInputs
         browser.get(url)
 
     def __getattr__(self, name):
@@ -58,7 +311,7 @@ class PortalBrowser:
             return None
 
     def acceptAlert(self, timeout=10):
-        WebDriverWait(self.browser, timeout).until(
+        self.wait(timeout).until(
             expected_conditions.alert_is_present()
             )
         self.browser.switch_to_alert().accept()
@@ -92,6 +345,20 @@ class PortalBrowser:
             repover = int(version.split('-')[1])
         return repover
 
+    def getCapabilities(self):
+        # The version is read from the page footer, so the browser must be
+        # showing a portal page the first time this is called
+        capabilities = _capabilities.get(self.url)
+        if capabilities is None:
+            capabilities = _capabilities[self.url] = PortalCapabilities(self.getRepoVersion())
+        return capabilities
+
+    def setStage(self, stage):
+        # Name the stage of the test for the command trace, returning the
+        # previous stage
+        if self.trace is not None:
+            return self.trace.setStage(stage)
+
     # Sign In
 
     def getSignOutLink(self):
@@ -114,6 +381,18 @@ class PortalBrowser:
             return False
         return True
 
+    def restoreCookies(self, cookies):
+        # Replace the browser's cookies for the portal with cookies saved
+        # from another browser session, and reload the page to use them.
+        # The browser must be showing a portal page.
+        self.browser.delete_all_cookies()
+        for cookie in cookies:
+            self.browser.add_cookie({
+                key: cookie[key] for key in ('name', 'value', 'path', 'secure', 'expiry')
+                if key in cookie
+                })
+        self.browser.refresh()
+
     def signInWithPassword(self, username, password):
         header = self.getPageHeader()
         link = header.find_element_by_partial_link_text("Log in")
@@ -134,34 +413,160 @@ class PortalBrowser:
     # All the wait... methods take the timeout and other parameters used in
     # WebDriverWait, but excluding the initial browser driver parameter
 
-    def wait(self, *args, **kw):
-        return WebDriverWait(self.browser, *args, **kw)
+    def wait(self, *args, name=None, **kw):
+        return AccountedWait(self.browser, *args, waitLog=self.waitLog, name=name, **kw)
+
+    def waitFor(self, name, condition, timeout, *args, **kw):
+        # Wait until condition(driver) is true, recording the wait as name
+        return self.wait(timeout, *args, name=name, **kw).until(condition)
+
+    def waitForAjax(self, timeout, *args, name='ajax idle', **kw):
+        return self.waitFor(name, scriptCondition(AJAX_IDLE_SCRIPT), timeout, *args, **kw)
+
+    def waitForMapTiles(self, timeout, *args, name='map tiles loaded', **kw):
+        return self.waitFor(name, scriptCondition(TILES_LOADED_SCRIPT), timeout, *args, **kw)
+
+    # Waits for the effect of an action are given a value read before the
+    # action, so they do not return at once before the action takes effect
+
+    def ajaxCount(self):
+        return self.browser.execute_script(AJAX_COUNT_SCRIPT)
+
+    def waitForAjaxAfter(self, count, timeout, *args, name='ajax done', **kw):
+        # Wait until a jQuery request has completed since ajaxCount returned
+        # count, and no requests are in progress
+        def condition(driver):
+            return driver.execute_script(
+                'return window.jQuery.active === 0 && window.portalTestAjaxCount > arguments[0];',
+                count
+                )
+        return self.waitFor(name, condition, timeout, *args, **kw)
+
+    def tileSources(self):
+        return self.browser.execute_script(TILE_SOURCES_SCRIPT)
+
+    def waitForNewMapTiles(self, sources, timeout, *args, name='new map tiles loaded', **kw):
+        # Wait until map tiles not in sources, from tileSources, have loaded
+        def condition(driver):
+            return driver.execute_script(NEW_TILES_LOADED_SCRIPT, sources)
+        return self.waitFor(name, condition, timeout, *args, **kw)
+
+    def polygonCount(self):
+        return self.browser.execute_script(POLYGON_COUNT_SCRIPT)
+
+    def waitForPolygon(self, count, timeout, *args, name='polygon drawn', **kw):
+        # Wait until there are more polygons than count, from polygonCount
+        def condition(driver):
+            return driver.execute_script(POLYGON_COUNT_SCRIPT) > count
+        return self.waitFor(name, condition, timeout, *args, **kw)
+
+    def waitForRefineGrid(self, timeout, *args, name='refine grid rendered', **kw):
+        return self.waitFor(name, scriptCondition(REFINE_GRID_SCRIPT), timeout, *args, **kw)
+
+    def waitForVisible(self, locator, timeout, *args, name='menu visible', **kw):
+        return self.waitFor(
+            name, expected_conditions.visibility_of_element_located(locator), timeout, *args, **kw
+            )
 
     def waitForRunStatusContains(self, status, *args, **kw):
-        WebDriverWait(self.browser, *args, **kw).until(
+        self.wait(*args, **kw).until(
             expected_conditions.text_to_be_present_in_element(
-                (By.XPATH, "//div[@id='run-info']/div[1]/p[3]"), status
+                (By.XPATH, RUN_STATUS_XPATH), status
                 )
             )
 
-    def getRunStatus(self):
-        text = self.find_element_by_xpath("//div[@id='run-info']/div[1]/p[3]").text
+    def parseRunStatus(self, text):
         assert text.startswith('Status:'), repr(text)
         return text.split(':', 1)[1].strip()
 
+    def getRunStatusText(self):
+        return self.find_element_by_xpath(RUN_STATUS_XPATH).text
+
+    def getRunStatus(self):
+        return self.parseRunStatus(self.getRunStatusText())
+
+    # Longest time for a single wait in the browser. Long waits are split,
+    # so that the WebDriver connection is not idle for too long.
+    observeInterval = 60
+
+    def observeRunStatusChange(self, text, timeout):
+        # Wait for the text of the run status element to change from text,
+        # and return the list of new texts, in the order they were seen.
+        # Returns an empty list if the text has not changed after timeout
+        # seconds, or None if the status cannot be observed (e.g. the page
+        # was reloaded).
+        start = time.time()
+        waitUntil = start + timeout
+        while True:
+            interval = max(0, min(waitUntil - time.time(), self.observeInterval))
+            self.browser.set_script_timeout(interval + 30)
+            try:
+                texts = self.browser.execute_async_script(
+                    OBSERVE_RUN_STATUS_SCRIPT, text, RUN_STATUS_XPATH, interval
+                    )
+            except WebDriverException:
+                texts = None
+            if texts is None or texts or time.time() >= waitUntil:
+                self.waitLog.append({
+                    'kind': 'wait', 'name': 'run status change', 'start': start,
+                    'seconds': time.time() - start,
+                    'timeout': timeout, 'timedOut': texts == [],
+                    })
+                return texts
+
     def watchRunStatus(self, func, timeout, *args, **kw):
+        # Call func with each new run status, until it returns a value other
+        # than None. args and kw are passed to WebDriverWait when polling.
         watchUntil = time.time() + timeout
+        texts = [self.getRunStatusText()]
         while True:
-            status = self.getRunStatus()
-            result = func(status)
-            if result is not None:
-                return result
+            for text in texts:
+                status = self.parseRunStatus(text)
+                self.recordStatus(status, text)
+                result = func(status)
+                if result is not None:
+                    return result
             timeout = watchUntil - time.time()
-            self.wait(timeout, *args, **kw).until_not(
-                expected_conditions.text_to_be_present_in_element(
-                    (By.XPATH, "//div[@id='run-info']/div[1]/p[3]"), status
+            texts = None
+            if self.observeStatus:
+                texts = self.observeRunStatusChange(text, timeout)
+                if texts == []:
+                    raise TimeoutException('Run status still {0!r}'.format(status))
+            if texts is None:
+                self.wait(timeout, *args, **kw).until_not(
+                    expected_conditions.text_to_be_present_in_element(
+                        (By.XPATH, RUN_STATUS_XPATH), status
+                        )
                     )
-                )
+                texts = [self.getRunStatusText()]
+
+    def recordStatus(self, status, text):
+        timeline = self.statusTimeline
+        if timeline is not None and (not timeline or timeline[-1]['text'] != text):
+            timeline.append({'time': time.time(), 'status': status, 'text': text})
+
+    def getRunOutputs(self):
+        # Return the run page URL, and a list of dicts, containing the name,
+        # mimeType (including parentheses) and href of each run output, all
+        # read using a single request to the browser
+        page = self.browser.execute_script(RUN_OUTPUTS_SCRIPT)
+        if page is None:
+            raise NoSuchElementException('run-outputs')
+        return page['url'], page['outputs']
+
+    def getAdvancedSection(self):
+        # Return the text of each element in the Advanced section of the run
+        # page, read using a single request to the browser
+        texts = self.browser.execute_script(ADVANCED_SECTION_SCRIPT)
+        if texts is None:
+            raise NoSuchElementException('advanced')
+        return texts
+
+    def getFailureState(self):
+        # Return the URL and source of the page, and the text of each element
+        # in the Advanced section (None if there is none), read using a
+        # single request to the browser
+        return self.browser.execute_script(FAILURE_STATE_SCRIPT)
 
     def waitForInteraction(self, timeout, *args, **kw):
         class WithInteractionPage:
@@ -200,14 +605,16 @@ class PortalBrowser:
                 # The parent dialog has a specified size, so should not return 0
                 self.dialog = modal_interaction_dialog.find_element_by_xpath('..')
                 self.portal.switch_to_frame(self.iframe)
+                self.previousStage = self.portal.setStage('interaction')
                 return self
 
             def __exit__(self, type, value, tb):
+                self.portal.setStage(self.previousStage)
                 if type:
                     pass
                 else:
                     self.portal.switch_to_default_content()
-                    if self.portal.getRepoVersion() >= 10584:
+                    if self.portal.getCapabilities().interactionDetaches:
                         # wait for interaction to be detached from DOM, to avoid
                         # subsequent waits for interaction pages from finding
                         # this interaction.
@@ -266,9 +673,20 @@ class RunInputs:
         textArea = self.workflow_input.find_element_by_xpath(
             './*[@data-input-name="{0}"]//textarea'.format(name)
             )
+        value = str(value)
+        if not self.portal.typeInputs:
+            # Setting the value directly takes the same time for any length
+            # of value. Browsers store textarea line endings as \n.
+            result = self.portal.execute_script(SET_VALUE_SCRIPT, textArea, value)
+            if result == value.replace('\r\n', '\n'):
+                return
+            # Delete the value that was set, rather than the initial text
+            existing = result
+        else:
+            existing = textArea.text
         action_chains = ActionChains(self.portal.browser)
         action_chains.move_to_element(textArea).click().send_keys(
-            Keys.BACK_SPACE*len(textArea.text)+str(value)
+            Keys.BACK_SPACE*len(existing)+value
             ).perform()
 
     def setInputFile(self, name, path):
@@ -0,0 +1,468 @@
+'''HTTP client for setting up and removing portal state without a browser.
+
+The client follows the same links and submits the same forms as a user of
+the browser would, but using plain HTTP requests, so tests can upload
+workflows, start runs, and delete them again, in a fraction of the time it
+takes to drive the browser through the pages.  The client shares the
+session cookies of the browser, so it acts as the user signed in to the
+browser.
+'''
+
+import html.parser, os, time, urllib.parse
+
+import requests
+
+
+class PortalClientError(Exception):
+    pass
+
+
+# Elements that never have an end tag
+VOID_ELEMENTS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr'
+    ))
+
+
+class Control:
+
+    def __init__(self, tag, attrs, inputName):
+        self.tag = tag
+        self.attrs = attrs
+        self.type = attrs.get('type', 'text').lower() if tag == 'input' else tag
+        self.name = attrs.get('name')
+        self.id = attrs.get('id')
+        self.value = attrs.get('value', '')
+        self.checked = 'checked' in attrs
+        # For select controls, a list of [value, text, selected]
+        self.options = []
+        # The data-input-name of the workflow input containing the control
+        self.inputName = inputName
+
+
+class Form:
+
+    def __init__(self, attrs):
+        self.action = attrs.get('action', '')
+        self.method = attrs.get('method', 'get').lower()
+        self.controls = []
+
+    def find(self, **kw):
+        # Return the first control with matching attributes, or None
+        for control in self.controls:
+            if all(getattr(control, key) == value for key, value in kw.items()):
+                return control
+        return None
+
+    def submitData(self, submit=None):
+        # Return the data and files sent when the form is submitted using
+        # the submit button control
+        data = []
+        files = []
+        for control in self.controls:
+            if not control.name:
+                continue
+            if control.type in ('submit', 'button', 'image', 'reset'):
+                if control is submit:
+                    data.append((control.name, control.value))
+            elif control.type in ('checkbox', 'radio'):
+                if control.checked:
+                    data.append((control.name, control.value or 'on'))
+            elif control.type == 'file':
+                if control.value:
+                    files.append((control.name, control.value))
+            elif control.type == 'select':
+                selected = [option for option in control.options if option[2]]
+                if not selected and control.options and 'multiple' not in control.attrs:
+                    selected = control.options[:1]
+                for value, text, isSelected in selected:
+                    data.append((control.name, value))
+            else:
+                data.append((control.name, control.value))
+        return data, files
+
+
+class Link:
+
+    def __init__(self, attrs, ancestors=()):
+        self.href = attrs.get('href')
+        self.attrs = attrs
+        self.text = ''
+        # The attributes of the elements containing the link
+        self.ancestors = ancestors
+
+
+class PageParser(html.parser.HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.forms = []
+        self.links = []
+        self.meta = {}
+        self.flash = {}
+        # Text of each paragraph in the run-info element
+        self.runInfo = []
+        self.paragraph = None
+        self.stack = []
+        self.form = None
+        self.link = None
+        self.control = None
+        self.option = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: ('' if value is None else value) for key, value in attrs}
+        if tag not in VOID_ELEMENTS:
+            self.stack.append((tag, attrs))
+        if tag == 'form':
+            self.form = Form(attrs)
+            self.forms.append(self.form)
+        elif tag in ('input', 'textarea', 'select', 'button'):
+            inputName = None
+            for openTag, openAttrs in reversed(self.stack):
+                if 'data-input-name' in openAttrs:
+                    inputName = openAttrs['data-input-name']
+                    break
+            control = Control(tag, attrs, inputName)
+            if tag == 'button':
+                control.type = attrs.get('type', 'submit').lower()
+            if self.form is not None:
+                self.form.controls.append(control)
+            if tag in ('textarea', 'select'):
+                self.control = control
+        elif tag == 'option' and self.control is not None:
+            self.option = [attrs.get('value'), '', 'selected' in attrs]
+            self.control.options.append(self.option)
+        elif tag == 'a':
+            self.link = Link(attrs, [openAttrs for openTag, openAttrs in self.stack[:-1]])
+            self.links.append(self.link)
+        elif tag == 'p' and any(openAttrs.get('id') == 'run-info' for openTag, openAttrs in self.stack):
+            self.paragraph = ['']
+            self.runInfo.append(self.paragraph)
+        elif tag == 'meta' and 'name' in attrs:
+            self.meta[attrs['name']] = attrs.get('content', '')
+        if attrs.get('id') in ('notice_flash', 'error_flash'):
+            self.flash[attrs['id']] = ''
+
+    def handle_endtag(self, tag):
+        if tag == 'form':
+            self.form = None
+        elif tag in ('textarea', 'select'):
+            self.control = None
+        elif tag == 'option':
+            self.option = None
+        elif tag == 'a':
+            self.link = None
+        elif tag == 'p':
+            self.paragraph = None
+        # Close the element, and any unclosed elements inside it
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                del self.stack[i:]
+                break
+
+    def handle_data(self, data):
+        if self.option is not None:
+            self.option[1] += data
+        elif self.control is not None and self.control.tag == 'textarea':
+            self.control.value += data
+        if self.link is not None:
+            self.link.text += data
+        for tag, attrs in self.stack:
+            if attrs.get('id') in self.flash:
+                self.flash[attrs['id']] += data
+        if self.paragraph is not None:
+            self.paragraph[-1] += data
+
+
+class Page:
+
+    def __init__(self, response):
+        self.response = response
+        self.url = response.url
+        parser = PageParser()
+        parser.feed(response.text)
+        parser.close()
+        for form in parser.forms:
+            for control in form.controls:
+                for option in control.options:
+                    option[1] = option[1].strip()
+                    if option[0] is None:
+                        option[0] = option[1]
+        self.forms = parser.forms
+        self.links = parser.links
+        self.meta = parser.meta
+        self.flash = {key: ' '.join(value.split()) for key, value in parser.flash.items()}
+        self.runInfo = [' '.join(paragraph[0].split()) for paragraph in parser.runInfo]
+
+    def getFlashNotice(self):
+        return self.flash.get('notice_flash')
+
+    def getFlashError(self):
+        return self.flash.get('error_flash')
+
+    def getRunStatus(self):
+        # Return the run status shown on a run page, or None
+        for text in self.runInfo:
+            if text.startswith('Status:'):
+                return text.split(':', 1)[1].strip()
+        return None
+
+    def getOutputLinks(self):
+        # Return the download link of each output on a run page, by name.
+        # Each output is a div containing an anchor named by the output, and
+        # the download link.
+        names = {}
+        hrefs = {}
+        for link in self.links:
+            if not any(attrs.get('id') == 'run-outputs' for attrs in link.ancestors):
+                continue
+            outputs = [attrs for attrs in link.ancestors if attrs.get('class') == 'output']
+            if not outputs:
+                continue
+            key = id(outputs[-1])
+            if link.attrs.get('id') and outputs[-1] is link.ancestors[-1]:
+                names.setdefault(key, link.attrs['id'])
+            if link.href:
+                hrefs.setdefault(key, urllib.parse.urljoin(self.url, link.href))
+        return {names[key]: href for key, href in hrefs.items() if key in names}
+
+    def findLink(self, partialText):
+        for link in self.links:
+            if partialText in link.text and link.href:
+                return link
+        raise PortalClientError('No link "{0}" on {1}'.format(partialText, self.url))
+
+    def findForm(self, **kw):
+        # Return the form containing a control with matching attributes
+        for form in self.forms:
+            if form.find(**kw) is not None:
+                return form
+        raise PortalClientError('No form with control {0} on {1}'.format(kw, self.url))
+
+
+# Keep-alive connection pools, shared by all clients for the same portal
+_adapters = {}
+
+def connectionPool(url):
+    # Return the URL prefix for the portal host, and its connection pool
+    parts = urllib.parse.urlsplit(url)
+    prefix = '{0}://{1}/'.format(parts.scheme, parts.netloc)
+    adapter = _adapters.get(prefix)
+    if adapter is None:
+        adapter = _adapters[prefix] = requests.adapters.HTTPAdapter(pool_maxsize=16)
+    return prefix, adapter
+
+
+class PortalClient:
+
+    def __init__(self, url, session=None, cassette=None):
+        # Each client has its own cookies, but connections to the portal
+        # are reused by all clients
+        self.url = url
+        self.session = session or requests.Session()
+        self.session.mount(*connectionPool(url))
+        # Session used to download run outputs, with the same cookies. If a
+        # Cassette is given, downloads are recorded or replayed by it.
+        self.downloads = self.session
+        if cassette is not None:
+            self.downloads = requests.Session()
+            self.downloads.cookies = self.session.cookies
+            cassette.mount(self.downloads, connectionPool(url)[1])
+
+    def copyCookies(self, browser):
+        # Use the session cookies of the browser, which must be showing a
+        # portal page
+        self.session.cookies.clear()
+        for cookie in browser.get_cookies():
+            self.session.cookies.set(cookie['name'], cookie['value'], path=cookie.get('path', '/'))
+
+    def get(self, url):
+        response = self.session.get(urllib.parse.urljoin(self.url, url))
+        response.raise_for_status()
+        return Page(response)
+
+    def submit(self, page, form, submit=None):
+        data, files = form.submitData(submit)
+        url = urllib.parse.urljoin(page.url, form.action or page.url)
+        if form.method == 'get':
+            response = self.session.get(url, params=data)
+        else:
+            handles = [(name, open(path, 'rb')) for name, path in files]
+            try:
+                response = self.session.post(
+                    url, data=data,
+                    files=[(name, (os.path.basename(f.name), f)) for name, f in handles] or None
+                    )
+            finally:
+                for name, f in handles:
+                    f.close()
+        response.raise_for_status()
+        return Page(response)
+
+    def follow(self, page, link):
+        # Follow a link. Links with a data-method attribute are followed
+        # the way the Rails JavaScript does, using a POST request with the
+        # method and the page's CSRF token.
+        url = urllib.parse.urljoin(page.url, link.href)
+        method = link.attrs.get('data-method', 'get').lower()
+        if method == 'get':
+            response = self.session.get(url)
+        else:
+            data = {'_method': method}
+            param = page.meta.get('csrf-param')
+            if param:
+                data[param] = page.meta.get('csrf-token', '')
+            response = self.session.post(url, data=data)
+        response.raise_for_status()
+        return Page(response)
+
+    def expectNotice(self, page, notice):
+        message = page.getFlashNotice()
+        if not message or notice not in message:
+            raise PortalClientError('Expected "{0}" on {1}, got notice={2!r} error={3!r}'.format(
+                notice, page.url, message, page.getFlashError()
+                ))
+
+    def isSignedIn(self, page):
+        return any('Log out' in link.text for link in page.links)
+
+    def signIn(self, username, password):
+        self.session.cookies.clear()
+        page = self.get(self.url)
+        try:
+            form = page.findForm(id='login_button')
+        except PortalClientError:
+            page = self.follow(page, page.findLink('Log in'))
+            form = page.findForm(id='login_button')
+        form.find(id='login').value = username
+        form.find(id='password').value = password
+        page = self.submit(page, form, form.find(id='login_button'))
+        if not self.isSignedIn(page):
+            raise PortalClientError('Cannot sign in as {0}: {1}'.format(username, page.getFlashError()))
+
+    def signOut(self):
+        page = self.get(self.url)
+        for link in page.links:
+            if 'Log out' in link.text and link.href:
+                self.follow(page, link)
+                return True
+        return False
+
+    def uploadWorkflow(self, filename, category):
+        # Upload a workflow file, keeping it private, and return the URL of
+        # the new workflow
+        page = self.get(self.url)
+        page = self.follow(page, page.findLink('Workflows'))
+        page = self.follow(page, page.findLink('Upload a workflow'))
+        form = page.findForm(id='workflow_data')
+        form.find(id='workflow_data').value = filename
+        select = form.find(id='workflow_category_id')
+        for option in select.options:
+            option[2] = option[1] == category
+        if not any(option[2] for option in select.options):
+            raise PortalClientError('No workflow category "{0}"'.format(category))
+        sharing = form.find(id='sharing_scope_0')
+        for control in form.controls:
+            if control.name == sharing.name:
+                control.checked = control is sharing
+        page = self.submit(page, form, form.find(id='workflow_submit_btn'))
+        self.expectNotice(page, 'Workflow was successfully uploaded and saved')
+        form = page.findForm(name='commit')
+        page = self.submit(page, form, form.find(name='commit'))
+        self.expectNotice(page, 'Workflow was successfully updated')
+        return page.url
+
+    def startRun(self, workflowURL, textInputs=None, fileInputs=None):
+        # Start a run of the workflow, returning the URL of the run. Text
+        # input values must already be encoded as strings.
+        page = self.get(workflowURL)
+        page = self.follow(page, page.findLink('Run workflow'))
+        form = page.findForm(value='Start Run')
+        for name, value in (textInputs or {}).items():
+            control = form.find(tag='textarea', inputName=name)
+            if control is None:
+                raise PortalClientError('No text input "{0}"'.format(name))
+            control.value = value
+        for name, path in (fileInputs or {}).items():
+            control = form.find(type='file', inputName=name)
+            if control is None:
+                raise PortalClientError('No file input "{0}"'.format(name))
+            control.value = path
+        page = self.submit(page, form, form.find(value='Start Run'))
+        self.expectNotice(page, 'Run was successfully created')
+        return page.url
+
+    def watchRunStatus(self, runURL, func, timeout, interval=1):
+        # Call func with each new status shown on the run page, polling
+        # every interval seconds, until it returns a value other than None
+        waitUntil = time.time() + timeout
+        status = None
+        while True:
+            newStatus = self.get(runURL).getRunStatus()
+            if newStatus != status:
+                status = newStatus
+                result = func(status)
+                if result is not None:
+                    return result
+            if time.time() > waitUntil:
+                raise PortalClientError('Run status still {0!r} after {1}s'.format(status, timeout))
+            time.sleep(interval)
+
+    def pageExists(self, page):
+        message = page.getFlashError()
+        return not (message and 'does not exist' in message)
+
+    def urlExists(self, url):
+        try:
+            page = self.get(url)
+        except requests.HTTPError as exc:
+            if exc.response.status_code == 404:
+                return False
+            raise
+        return self.pageExists(page)
+
+    def cancelRun(self, runURL):
+        # Cancel the run, if it is still running. Returns False if the run
+        # does not exist.
+        page = self.get(runURL)
+        if not self.pageExists(page):
+            return False
+        try:
+            link = page.findLink('Cancel')
+        except PortalClientError:
+            pass
+        else:
+            self.follow(page, link)
+        return True
+
+    def deleteRun(self, runURL, timeout=120):
+        # Delete the run, cancelling it first if necessary. Returns False if
+        # the run does not exist.
+        if not self.cancelRun(runURL):
+            return False
+        # The Delete link appears once the run has stopped
+        waitUntil = time.time() + timeout
+        while True:
+            page = self.get(runURL)
+            try:
+                link = page.findLink('Delete')
+            except PortalClientError:
+                if time.time() > waitUntil:
+                    raise
+                time.sleep(1)
+            else:
+                break
+        page = self.follow(page, link)
+        self.expectNotice(page, 'Run was deleted')
+        return True
+
+    def deleteWorkflow(self, workflowURL):
+        page = self.get(workflowURL)
+        if not self.pageExists(page):
+            return False
+        page = self.follow(page, page.findLink('Manage workflow'))
+        page = self.follow(page, page.findLink('Delete workflow'))
+        page = self.get(workflowURL)
+        if self.pageExists(page):
+            raise PortalClientError('Workflow {0} was not deleted'.format(workflowURL))
+        return True
@@ -0,0 +1,203 @@
+'''Write screenshots to disk on a background thread.
+
+Screenshots are taken in memory as PNG data, and handed to the writer, which
+crops them if needed and saves them, while the test carries on.  The queue
+of screenshots waiting to be written is bounded, so a test taking many
+screenshots waits for the writer rather than holding them all in memory.
+
+When screenshots are regenerated (e.g. for the tutorial documentation), each
+new screenshot is compared with the existing file.  If the pixels are the
+same, or differ in no more than a given fraction of the image, the existing
+file is kept, so only screenshots that really changed are rewritten.  A
+manifest of the pixel hash of each screenshot file and its status is kept in
+each screenshot directory, and for each changed screenshot, an image showing the
+changed pixels is saved in its diffs subdirectory.
+'''
+
+import hashlib, io, json, os, queue, sys, threading
+
+MANIFEST = 'screenshots.json'
+
+# Differences in a colour channel up to this are not counted as a change
+PIXEL_TOLERANCE = 16
+
+
+def pixelHash(im):
+    digest = hashlib.sha256('{0} {1}x{2} '.format(im.mode, *im.size).encode('ascii'))
+    digest.update(im.tobytes())
+    return digest.hexdigest()
+
+
+def changedPixels(old, new):
+    # Return a mask of the pixels that differ, and the fraction of pixels
+    # that differ, or None if the images have different sizes
+    from PIL import ImageChops
+    if old.size != new.size:
+        return None, 1.0
+    difference = ImageChops.difference(old.convert('RGB'), new.convert('RGB'))
+    # The largest difference in any channel
+    r, g, b = difference.split()
+    difference = ImageChops.lighter(ImageChops.lighter(r, g), b)
+    mask = difference.point(lambda v: 255 if v > PIXEL_TOLERANCE else 0)
+    changed = mask.histogram()[255]
+    return mask, changed / (new.size[0] * new.size[1])
+
+
+class ScreenshotWriter:
+
+    def __init__(self, maxQueue=8, threshold=None):
+        # threshold - fraction of pixels that can change without the
+        # screenshot being rewritten, or None to always rewrite screenshots
+        self.queue = queue.Queue(maxQueue)
+        self.threshold = threshold
+        self.errors = []
+        self.thread = None
+        # Manifest entries of the screenshots written or kept, by directory
+        # and file name
+        self.results = {}
+
+    def put(self, task):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='ScreenshotWriter', daemon=True)
+            self.thread.start()
+        self.queue.put(task)
+
+    def write(self, filename, png, box=None):
+        # Save the PNG data to filename, cropped to box (left, top, right,
+        # bottom) if it is given
+        self.put((self.save, filename, png, box))
+
+    def rename(self, filename, newFilename):
+        # Rename a screenshot, once it has been written
+        self.put((self.move, filename, newFilename))
+
+    def remove(self, filename):
+        self.put((self.delete, filename))
+
+    def run(self):
+        while True:
+            task = self.queue.get()
+            try:
+                task[0](*task[1:])
+            except Exception as exc:
+                self.errors.append('{0}: {1}'.format(task[1], exc))
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        # Wait until all screenshots have been written, and raise an error
+        # if any could not be written
+        self.queue.join()
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise OSError('Cannot write screenshots:\n' + '\n'.join(errors))
+
+    def setResult(self, filename, entry):
+        directory, name = os.path.split(filename)
+        self.results.setdefault(directory, {})[name] = entry
+
+    def compare(self, filename, new):
+        # Compare the image new with the existing file, returning the
+        # manifest entry for new, and the mask of changed pixels
+        entry = {'hash': pixelHash(new), 'size': list(new.size), 'status': 'new', 'changed': None}
+        if not os.path.exists(filename):
+            return entry, None
+        from PIL import Image
+        with Image.open(filename) as old:
+            oldHash = pixelHash(old)
+            if oldHash == entry['hash']:
+                entry.update(status='unchanged', changed=0.0)
+                return entry, None
+            mask, changed = changedPixels(old, new)
+        entry['changed'] = changed
+        if changed <= self.threshold:
+            # The existing file is kept, so the manifest gives its hash
+            entry.update(status='unchanged', hash=oldHash, newHash=entry['hash'])
+        else:
+            entry['status'] = 'changed'
+        return entry, mask
+
+    def saveDiff(self, filename, mask):
+        if mask is not None:
+            directory, name = os.path.split(filename)
+            os.makedirs(os.path.join(directory, 'diffs'), exist_ok=True)
+            mask.save(os.path.join(directory, 'diffs', name))
+
+    def save(self, filename, png, box):
+        if self.threshold is None:
+            if box is None:
+                with open(filename, 'wb') as f:
+                    f.write(png)
+            else:
+                from PIL import Image
+                with Image.open(io.BytesIO(png)) as im:
+                    im.crop(box).save(filename)
+            return
+        from PIL import Image
+        with Image.open(io.BytesIO(png)) as im:
+            im = im.crop(box) if box is not None else im.copy()
+        entry, mask = self.compare(filename, im)
+        if entry['status'] != 'unchanged':
+            if box is None:
+                with open(filename, 'wb') as f:
+                    f.write(png)
+            else:
+                im.save(filename)
+            self.saveDiff(filename, mask)
+        self.setResult(filename, entry)
+
+    def move(self, filename, newFilename):
+        if self.threshold is None:
+            os.replace(filename, newFilename)
+            return
+        # The screenshot has only just been written, so compare it with the
+        # file it replaces
+        from PIL import Image
+        with Image.open(filename) as im:
+            entry, mask = self.compare(newFilename, im)
+        if entry['status'] == 'unchanged':
+            os.remove(filename)
+        else:
+            os.replace(filename, newFilename)
+            self.saveDiff(newFilename, mask)
+        directory, name = os.path.split(filename)
+        self.results.get(directory, {}).pop(name, None)
+        self.setResult(newFilename, entry)
+
+    def delete(self, filename):
+        os.remove(filename)
+        directory, name = os.path.split(filename)
+        self.results.get(directory, {}).pop(name, None)
+
+    def writeReport(self, stream=sys.stderr):
+        # Update the manifest in each screenshot directory, print the number
+        # of new, changed and unchanged screenshots, and then raise an error
+        # if any screenshots or manifests could not be written
+        self.queue.join()
+        for directory, results in self.results.items():
+            manifestFile = os.path.join(directory, MANIFEST)
+            try:
+                with open(manifestFile, 'rt') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = {}
+            for name, entry in manifest.items():
+                if name not in results:
+                    entry['status'] = 'not taken'
+            manifest.update(results)
+            try:
+                with open(manifestFile, 'wt') as f:
+                    json.dump(manifest, f, indent=2, sort_keys=True)
+            except OSError as exc:
+                self.errors.append('{0}: {1}'.format(manifestFile, exc))
+            counts = {}
+            for entry in manifest.values():
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+            stream.write('Screenshots in {0}: {1}\n'.format(
+                directory or '.', ', '.join('{0} {1}'.format(n, status) for status, n in sorted(counts.items()))
+                ))
+            for name, entry in sorted(results.items()):
+                if entry['status'] == 'changed':
+                    stream.write('  changed: {0} ({1:.2%} of pixels)\n'.format(name, entry['changed']))
+        self.results = {}
+        self.flush()
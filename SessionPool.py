@@ -0,0 +1,119 @@
+'''Pool of running browser sessions, shared by the tests in a process.
+
+Starting a browser takes several seconds, so rather than starting a new
+browser for each test, browsers are returned to the pool at the end of a
+test, reset to a clean state, and handed to the next test that asks for the
+same kind of browser.  A browser is quit and replaced after it has been used
+a given number of times, or if its memory use has grown too much.
+'''
+
+from selenium.common.exceptions import NoAlertPresentException, WebDriverException
+
+try:
+    import psutil
+except ImportError:
+    # Without psutil, the memory use of browsers is not checked
+    psutil = None
+
+
+class PooledSession:
+
+    def __init__(self, key, driver):
+        self.key = key
+        self.driver = driver
+        self.uses = 0
+        self.baseMemory = None
+
+    def memoryUse(self):
+        # Return the resident memory used by the driver service and the
+        # browser processes it started, or None if it cannot be determined.
+        service = getattr(self.driver, 'service', None)
+        process = getattr(service, 'process', None)
+        if psutil is None or process is None:
+            return None
+        try:
+            parent = psutil.Process(process.pid)
+            processes = [parent] + parent.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes)
+        except psutil.Error:
+            return None
+
+
+class SessionPool:
+
+    def __init__(self, maxUses=None, maxMemoryGrowth=None):
+        # maxUses - number of tests a browser is used for before it is
+        # replaced, or None for no limit.  Use 1 to start a new browser for
+        # every test.
+        # maxMemoryGrowth - growth in memory use (in bytes) since the first
+        # use, after which a browser is replaced, or None for no limit.
+        self.maxUses = maxUses
+        self.maxMemoryGrowth = maxMemoryGrowth
+        self.idle = {}
+        self.active = {}
+
+    def acquire(self, key, factory):
+        # Return a running browser for key, starting one using factory if
+        # there is no idle browser available.
+        idle = self.idle.get(key)
+        if idle:
+            session = idle.pop()
+        else:
+            session = PooledSession(key, factory())
+        session.uses += 1
+        self.active[id(session.driver)] = session
+        return session.driver
+
+    def release(self, driver, url):
+        # Return a browser to the pool. The browser is reset by loading url,
+        # and removing any cookies and stored data for that site.
+        session = self.active.pop(id(driver))
+        if self.maxUses is not None and session.uses >= self.maxUses:
+            self.quit(session)
+            return
+        try:
+            self.reset(driver, url)
+        except WebDriverException:
+            # Browser is in a bad state, so start again next time
+            self.quit(session)
+            return
+        memory = session.memoryUse()
+        if memory is not None:
+            if session.baseMemory is None:
+                session.baseMemory = memory
+            elif self.maxMemoryGrowth is not None and memory - session.baseMemory > self.maxMemoryGrowth:
+                self.quit(session)
+                return
+        self.idle.setdefault(session.key, []).append(session)
+
+    def discard(self, driver):
+        # Quit a browser, rather than returning it to the pool
+        self.quit(self.active.pop(id(driver)))
+
+    def reset(self, driver, url):
+        # Dismiss any alert left open, as it blocks all other commands
+        try:
+            driver.switch_to_alert().dismiss()
+        except NoAlertPresentException:
+            pass
+        driver.switch_to_default_content()
+        driver.get(url)
+        driver.delete_all_cookies()
+        driver.execute_script(
+            'try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}'
+            )
+
+    def quit(self, session):
+        try:
+            session.driver.quit()
+        except WebDriverException:
+            pass
+
+    def closeAll(self):
+        for sessions in self.idle.values():
+            for session in sessions:
+                self.quit(session)
+        self.idle.clear()
+        for session in list(self.active.values()):
+            self.quit(session)
+        self.active.clear()
@@ -0,0 +1,84 @@
+'''Workflows uploaded once, and shared by all the tests in a session.
+
+Uploading a large workflow takes a while, so rather than each test uploading
+its own copy of the workflow and deleting it afterwards, the first test to
+need a workflow file uploads it, and later tests in the same session use the
+same workflow.  Workflows are identified by the SHA-256 hash of the file, so
+a changed file is uploaded again.  The workflows are deleted when the
+session ends.
+
+The uploaded workflows are recorded in a file, so that if a session ends
+without deleting its workflows (e.g. it was interrupted), the next session
+reuses them if they still exist, or deletes them otherwise.
+'''
+
+import json, os, threading
+
+import FixtureCache
+
+
+class SharedWorkflows:
+
+    def __init__(self, client, recordFile):
+        # client - PortalClient signed in as the user that owns the
+        # workflows, used to check and delete them
+        # recordFile - file recording the uploaded workflows. Each user of
+        # each portal (and each parallel worker) needs its own file.
+        self.client = client
+        self.recordFile = recordFile
+        self.used = {}
+        self.lock = threading.Lock()
+
+    def loadRecord(self):
+        try:
+            with open(self.recordFile, 'rt') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def saveRecord(self, record):
+        os.makedirs(os.path.dirname(self.recordFile) or '.', exist_ok=True)
+        tmpfile = self.recordFile + '.tmp'
+        with open(tmpfile, 'wt') as f:
+            json.dump(record, f, indent=2, sort_keys=True)
+        os.replace(tmpfile, self.recordFile)
+
+    def get(self, filename, topic, upload):
+        # Return the URL of the shared workflow for the file, calling
+        # upload(filename, topic) to upload it if there is none
+        key = '{0} {1}'.format(FixtureCache.fileDigest(filename), topic)
+        with self.lock:
+            url = self.used.get(key)
+            if url is not None:
+                return url
+            record = self.loadRecord()
+            entry = record.get(key)
+            if entry is not None and self.client.urlExists(entry['url']):
+                url = entry['url']
+            else:
+                url = upload(filename, topic)
+                record[key] = {'url': url, 'filename': filename}
+                self.saveRecord(record)
+            self.used[key] = url
+            return url
+
+    def removeAll(self):
+        # Delete the shared workflows, including any left by earlier
+        # sessions.  Workflows that cannot be deleted are kept in the record,
+        # so the next session tries again, and are reported once the others
+        # have been deleted.
+        from PortalClient import PortalClientError
+        failures = []
+        with self.lock:
+            record = self.loadRecord()
+            for key, entry in list(record.items()):
+                try:
+                    self.client.deleteWorkflow(entry['url'])
+                except Exception as exc:
+                    failures.append('{0}: {1}'.format(entry['url'], exc))
+                    continue
+                del record[key]
+                self.saveRecord(record)
+            self.used.clear()
+        if failures:
+            raise PortalClientError('Cannot delete shared workflows:\n' + '\n'.join(failures))
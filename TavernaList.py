@@ -0,0 +1,147 @@
+'''Encode workflow input values as Taverna list strings.
+
+A text input to a workflow port of depth 1 or more is entered as a list,
+e.g. [1,2,3], or [[a,b],[c]] for depth 2.  Values can be strings and numbers,
+nested to any depth in lists, tuples, generators or NumPy arrays.  The text
+is written as it is produced, so large values do not build up intermediate
+strings, and the depth of the encoded value is returned, so that it can be
+checked against the depth declared for the workflow input port.
+'''
+
+import io, itertools
+
+
+class ListDepthError(ValueError):
+    pass
+
+
+def isArray(value):
+    # NumPy arrays, recognised without importing numpy
+    return hasattr(value, 'ndim') and hasattr(value, 'astype') and hasattr(value, 'tolist')
+
+
+def combineDepth(current, depth):
+    # Depths are (depth, exact) pairs.  An empty list has depth 1 if it is
+    # on its own, but fits in a list of any depth, so its depth is not exact.
+    if current is None:
+        return depth
+    (d1, exact1), (d2, exact2) = current, depth
+    if exact1 and exact2:
+        if d1 != d2:
+            raise ListDepthError('List mixes items of depth {0} and {1}'.format(d1, d2))
+        return current
+    if exact1 or exact2:
+        (minimum, unused), exact = (depth, current) if exact1 else (current, depth)
+        if minimum > exact[0]:
+            raise ListDepthError('List mixes items of depth {0} and {1}'.format(minimum, exact[0]))
+        return exact
+    return (max(d1, d2), False)
+
+
+def writeArray(array, write):
+    # Write a non-empty NumPy array of numbers or strings, formatting a row
+    # of the last axis at a time
+    shape = array.shape
+    texts = array.astype(str).reshape(-1, shape[-1])
+    leading = shape[:-1]
+    for row, index in enumerate(itertools.product(*[range(n) for n in leading])):
+        opening = 1
+        for i in reversed(range(len(index))):
+            if index[i] != 0:
+                break
+            opening += 1
+        closing = 1
+        for i in reversed(range(len(index))):
+            if index[i] != leading[i] - 1:
+                break
+            closing += 1
+        if row:
+            write(',')
+        write('[' * opening)
+        write(','.join(texts[row].tolist()))
+        write(']' * closing)
+    return (len(shape), True)
+
+
+def writeItem(value, write):
+    # Write a value that is not encoded as a list, returning its depth, or
+    # return None if the value is a list
+    if isinstance(value, str):
+        write(value)
+    elif isinstance(value, (bytes, bytearray)):
+        write(value.decode('utf-8'))
+    elif isArray(value):
+        if value.ndim == 0:
+            write(str(value))
+        elif value.size and value.dtype.kind in 'biufU':
+            return writeArray(value, write)
+        else:
+            return None
+    else:
+        try:
+            iter(value)
+        except TypeError:
+            # int, float
+            write(str(value))
+        else:
+            return None
+    return (0, True)
+
+
+def write(value, out):
+    # Write value to the file-like object out, and return the depth of the
+    # list, or 0 for a single value
+    write = out.write
+    depth = writeItem(value, write)
+    if depth is not None:
+        return depth[0]
+    # Lists are written using a stack of iterators, rather than recursion,
+    # so there is no limit on the depth of nesting.  Each entry holds the
+    # iterator, whether no items have been written yet, and the depth of
+    # the items so far.
+    stack = [[iter(value.tolist() if isArray(value) else value), True, None]]
+    write('[')
+    while stack:
+        entry = stack[-1]
+        try:
+            item = next(entry[0])
+        except StopIteration:
+            stack.pop()
+            write(']')
+            if entry[2] is None:
+                depth = (1, False)
+            else:
+                depth = (entry[2][0] + 1, entry[2][1])
+            if stack:
+                stack[-1][2] = combineDepth(stack[-1][2], depth)
+            continue
+        if entry[1]:
+            entry[1] = False
+        else:
+            write(',')
+        depth = writeItem(item, write)
+        if depth is None:
+            write('[')
+            stack.append([iter(item.tolist() if isArray(item) else item), True, None])
+        else:
+            entry[2] = combineDepth(entry[2], depth)
+    return depth[0]
+
+
+def encode(value):
+    # Return the Taverna list string for value, and its depth
+    out = io.StringIO()
+    depth = write(value, out)
+    return out.getvalue(), depth
+
+
+def inputDepths(t2flowFile):
+    # Return the depth declared for each input port of a workflow file
+    import xml.etree.ElementTree as ET
+    ns = {'t': 'http://taverna.sf.net/2008/xml/t2flow'}
+    depths = {}
+    for dataflow in ET.parse(t2flowFile).getroot().findall('t:dataflow', ns):
+        if dataflow.get('role') == 'top':
+            for port in dataflow.findall('t:inputPorts/t:port', ns):
+                depths[port.findtext('t:name', namespaces=ns)] = int(port.findtext('t:depth', '0', ns))
+    return depths
@@ -0,0 +1,181 @@
+'''Measure portal and Taverna Server latency using the Rconnect workflow.
+
+The Rconnect workflow runs a trivial R script, so the time taken by a run is
+almost all spent in the portal and Taverna Server.  This script uploads the
+workflow once, runs it repeatedly over HTTP, and for each run records:
+
+    created - time to submit the run form and get the new run page
+    queued - time spent in the Queued status
+    running - time from submitting the run until it is Running
+    finished - time from submitting the run until it is Finished
+    outputs - time to get the finished run page and read the output links
+    download - time to download the output value
+
+It prints the median and percentiles of each, saves the measurements, and
+compares the medians with a baseline saved from an earlier benchmark, e.g.
+before a new deployment:
+
+    python3 benchmarkRConnection.py -n 20 --save-baseline baseline.json
+    python3 benchmarkRConnection.py -n 20 --baseline baseline.json
+
+The portal, username and password are taken from config.py, as for the
+tests.  A registered user is needed, to upload the workflow.
+'''
+
+import argparse, json, math, os, sys, time
+
+import BaseTest
+import PortalClient
+
+
+WORKFLOW = 't2flow/Rconnect.t2flow'
+METRICS = ('created', 'queued', 'running', 'finished', 'outputs', 'download')
+RUNNING = frozenset((
+    'Running', 'Waiting for user input', 'Gathering run outputs and log',
+    'Running post-run tasks', 'Finished'
+    ))
+
+
+def percentile(values, p):
+    # Nearest-rank percentile of the sorted list values
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def measureRun(client, workflowURL, interval, timeout):
+    # Run the workflow once, and return the measurements
+    start = time.time()
+    runURL = client.startRun(workflowURL)
+    measurements = {'created': time.time() - start}
+    try:
+        # Time when each status was first seen
+        seen = {}
+        def watch(status):
+            seen.setdefault(status, time.time())
+            if status == 'Failed':
+                raise PortalClient.PortalClientError('Run {0} failed'.format(runURL))
+            if status == 'Finished':
+                return True
+        client.watchRunStatus(runURL, watch, timeout, interval)
+        running = min(t for status, t in seen.items() if status in RUNNING)
+        if 'Queued' in seen:
+            measurements['queued'] = min(
+                t for status, t in seen.items() if t > seen['Queued']
+                ) - seen['Queued']
+        measurements['running'] = running - start
+        measurements['finished'] = seen['Finished'] - start
+        measurements['statuses'] = sorted(seen, key=seen.get)
+
+        outputsStart = time.time()
+        links = client.get(runURL).getOutputLinks()
+        measurements['outputs'] = time.time() - outputsStart
+        if BaseTest.getCassette():
+            # Replay the download recorded for an earlier run
+            import Cassette
+            BaseTest.getCassette().alias(links['out'], '{0} output out'.format(Cassette.runKey(WORKFLOW)))
+        downloadStart = time.time()
+        value = client.downloads.get(links['out']).text
+        measurements['download'] = time.time() - downloadStart
+        if value != '28364':
+            raise PortalClient.PortalClientError('Unexpected output {0!r}'.format(value))
+    finally:
+        client.deleteRun(runURL)
+    return measurements
+
+
+def summarise(runs):
+    summary = {}
+    for metric in METRICS:
+        values = sorted(run[metric] for run in runs if metric in run)
+        if values:
+            summary[metric] = {
+                'n': len(values),
+                'min': values[0],
+                'median': percentile(values, 50),
+                'p90': percentile(values, 90),
+                'p95': percentile(values, 95),
+                'max': values[-1],
+            }
+    return summary
+
+
+def printSummary(summary, baseline, tolerance, stream):
+    # Print the summary, and return the metrics whose median is slower than
+    # the baseline median by more than the tolerance
+    regressions = []
+    stream.write('{0:<10} {1:>4} {2:>8} {3:>8} {4:>8} {5:>8} {6:>8}'.format(
+        'metric', 'n', 'min', 'median', 'p90', 'p95', 'max'
+        ))
+    stream.write('  baseline\n' if baseline else '\n')
+    for metric, s in summary.items():
+        stream.write('{0:<10} {n:>4} {min:8.2f} {median:8.2f} {p90:8.2f} {p95:8.2f} {max:8.2f}'.format(
+            metric, **s
+            ))
+        base = baseline.get(metric) if baseline else None
+        if base:
+            change = s['median'] / base['median'] - 1 if base['median'] else 0.0
+            slower = change > tolerance
+            if slower:
+                regressions.append(metric)
+            stream.write('  {0:8.2f} {1:+.0%}{2}'.format(base['median'], change, ' SLOWER' if slower else ''))
+        stream.write('\n')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the portal using the Rconnect workflow')
+    parser.add_argument('-n', '--runs', type=int, default=10, help='number of runs')
+    parser.add_argument('-i', '--interval', type=float, default=0.5,
+        help='seconds between checks of the run status')
+    parser.add_argument('-t', '--timeout', type=float, default=600, help='longest time for a run')
+    parser.add_argument('-o', '--output', default=os.path.join('artifacts', 'benchmark.json'),
+        help='file to save the measurements in')
+    parser.add_argument('--baseline', help='summary of an earlier benchmark to compare with')
+    parser.add_argument('--save-baseline', help='file to save the summary in, for later comparison')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+        help='fraction by which a median can be slower than the baseline')
+    args = parser.parse_args(argv)
+
+    if not BaseTest.username:
+        parser.error('a username is needed in config.py')
+    client = PortalClient.PortalClient(BaseTest.starturl, cassette=BaseTest.getCassette())
+    client.signIn(BaseTest.username, BaseTest.password)
+    workflowURL = client.uploadWorkflow(os.path.join(os.getcwd(), WORKFLOW), 'Other')
+    runs = []
+    failures = []
+    try:
+        for i in range(args.runs):
+            try:
+                runs.append(measureRun(client, workflowURL, args.interval, args.timeout))
+            except Exception as exc:
+                failures.append(str(exc))
+                print('Run {0}: {1}'.format(i + 1, exc), file=sys.stderr)
+            else:
+                print('Run {0}: finished in {1:.1f}s'.format(i + 1, runs[-1]['finished']), file=sys.stderr)
+    finally:
+        client.deleteWorkflow(workflowURL)
+
+    summary = summarise(runs)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'rt') as f:
+            baseline = json.load(f)
+    regressions = printSummary(summary, baseline, args.tolerance, sys.stdout)
+    if failures:
+        print('{0} of {1} runs failed'.format(len(failures), args.runs))
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'wt') as f:
+        json.dump({
+            'portal': BaseTest.starturl, 'time': time.time(), 'runs': runs,
+            'failures': failures, 'summary': summary,
+            }, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'wt') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if regressions or failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
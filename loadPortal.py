@@ -0,0 +1,216 @@
+'''Submit many concurrent workflow runs, to measure queue throughput.
+
+For each concurrency level, the workflow is run a number of times, with at
+most that many runs in progress at once, and new runs submitted at a given
+rate.  Each run is followed over HTTP through the Queued, Starting run and
+Running statuses until it finishes, and is deleted afterwards.  The report
+gives, for each concurrency level, the throughput of finished runs, the
+queueing delay (from submitting a run until it is Running), and the rate of
+failed runs, e.g.
+
+    python3 loadPortal.py -c 1,4,16 -n 32 -r 2 t2flow/Rconnect.t2flow
+
+The portal, username and password are taken from config.py, as for the
+tests.  A registered user is needed, to upload the workflow and delete the
+runs.
+'''
+
+import argparse, concurrent.futures, json, os, sys, threading, time
+
+import BaseTest
+import PortalClient
+import benchmarkRConnection
+
+
+RUNNING = benchmarkRConnection.RUNNING
+
+
+class LoadRun:
+
+    def __init__(self, number):
+        self.number = number
+        self.runURL = None
+        self.submitted = None
+        # Time when each status was first seen
+        self.seen = {}
+        self.error = None
+
+    def record(self):
+        started = [t for status, t in self.seen.items() if status in RUNNING]
+        return {
+            'number': self.number,
+            'url': self.runURL,
+            'submitted': self.submitted,
+            'statuses': self.seen,
+            'queueDelay': min(started) - self.submitted if started else None,
+            'duration': self.seen['Finished'] - self.submitted if 'Finished' in self.seen else None,
+            'error': self.error,
+        }
+
+
+class LoadGenerator:
+
+    # Number of runs deleted at once
+    deleteWorkers = 4
+
+    def __init__(self, client, workflowURL, interval=1, timeout=1800):
+        # client - PortalClient signed in as the user running the workflows
+        self.client = client
+        self.workflowURL = workflowURL
+        self.interval = interval
+        self.timeout = timeout
+        # Runs created and not yet deleted
+        self.created = set()
+        self.lock = threading.Lock()
+
+    def newClient(self):
+        # requests sessions should not be shared between threads, so each
+        # run uses its own client, signed in using the same cookies
+        client = PortalClient.PortalClient(self.client.url)
+        client.session.cookies.update(self.client.session.cookies)
+        return client
+
+    def run(self, run):
+        # Follow one run until it stops. The run is deleted afterwards, by
+        # finished, so deleting it does not count as part of the load.
+        client = self.newClient()
+        run.submitted = time.time()
+        try:
+            run.runURL = client.startRun(self.workflowURL)
+            with self.lock:
+                self.created.add(run.runURL)
+            def watch(status):
+                run.seen.setdefault(status, time.time())
+                if status == 'Failed':
+                    raise PortalClient.PortalClientError('Run failed')
+                if status == 'Finished':
+                    return True
+            client.watchRunStatus(run.runURL, watch, self.timeout, self.interval)
+        except Exception as exc:
+            run.error = str(exc)
+        return run
+
+    def finished(self, future, slots, deleter):
+        # Free the run's slot, and then delete the run in the background
+        slots.release()
+        run = future.result()
+        if run.runURL:
+            deleter.submit(self.delete, self.newClient(), run.runURL)
+
+    def delete(self, client, runURL):
+        try:
+            client.deleteRun(runURL)
+        except Exception as exc:
+            print('Cannot delete {0}: {1}'.format(runURL, exc), file=sys.stderr)
+        else:
+            with self.lock:
+                self.created.discard(runURL)
+
+    def generate(self, runs, concurrency, rate):
+        # Submit runs at rate per second (or all at once if rate is 0), with
+        # at most concurrency in progress, and return the run records and
+        # the time taken until the last run stopped. Runs are deleted in a
+        # separate pool, which is not timed.
+        slots = threading.Semaphore(concurrency)
+        start = time.time()
+        futures = []
+        with concurrent.futures.ThreadPoolExecutor(self.deleteWorkers) as deleter:
+            # The runs' executor is shut down first, so all their deletions
+            # have been submitted
+            with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+                for number in range(runs):
+                    if rate:
+                        delay = start + number / rate - time.time()
+                        if delay > 0:
+                            time.sleep(delay)
+                    slots.acquire()
+                    future = executor.submit(self.run, LoadRun(number))
+                    future.add_done_callback(lambda future: self.finished(future, slots, deleter))
+                    futures.append(future)
+                records = [future.result().record() for future in futures]
+                elapsed = time.time() - start
+        return records, elapsed
+
+    def cleanup(self):
+        # Delete any runs left, e.g. if the load was interrupted
+        for runURL in list(self.created):
+            self.delete(self.client, runURL)
+
+
+def summarise(concurrency, records, elapsed):
+    finished = [r for r in records if r['duration'] is not None]
+    delays = sorted(r['queueDelay'] for r in records if r['queueDelay'] is not None)
+    return {
+        'concurrency': concurrency,
+        'runs': len(records),
+        'finished': len(finished),
+        'elapsed': elapsed,
+        'throughput': len(finished) / elapsed * 60 if elapsed else 0.0,
+        'queueDelayMedian': benchmarkRConnection.percentile(delays, 50) if delays else None,
+        'queueDelayP90': benchmarkRConnection.percentile(delays, 90) if delays else None,
+        'failureRate': 1 - len(finished) / len(records) if records else 0.0,
+    }
+
+
+def printSummaries(summaries, stream):
+    def seconds(value):
+        return '       -' if value is None else '{0:8.1f}'.format(value)
+    stream.write('concurrency  runs  runs/min  delay p50  delay p90  failed\n')
+    for s in summaries:
+        stream.write('{0:>11} {1:>5} {2:9.2f} {3}   {4}   {5:6.1%}\n'.format(
+            s['concurrency'], s['runs'], s['throughput'],
+            seconds(s['queueDelayMedian']), seconds(s['queueDelayP90']), s['failureRate']
+            ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Submit concurrent workflow runs to the portal')
+    parser.add_argument('-c', '--concurrency', default='1,2,4,8',
+        help='comma-separated numbers of runs in progress at once')
+    parser.add_argument('-n', '--runs', type=int,
+        help='number of runs at each concurrency level (default: twice the concurrency)')
+    parser.add_argument('-r', '--rate', type=float, default=0,
+        help='runs submitted per second (default: as fast as allowed by the concurrency)')
+    parser.add_argument('-i', '--interval', type=float, default=1,
+        help='seconds between checks of each run status')
+    parser.add_argument('-t', '--timeout', type=float, default=1800, help='longest time for a run')
+    parser.add_argument('--topic', default='Other', help='workflow category used for the upload')
+    parser.add_argument('-o', '--output', default=os.path.join('artifacts', 'load.json'),
+        help='file to save the run records in')
+    parser.add_argument('workflow', nargs='?', default=benchmarkRConnection.WORKFLOW,
+        help='workflow file to run, which must not need any inputs')
+    args = parser.parse_args(argv)
+
+    if not BaseTest.username:
+        parser.error('a username is needed in config.py')
+    levels = [int(level) for level in args.concurrency.split(',')]
+    client = PortalClient.PortalClient(BaseTest.starturl)
+    client.signIn(BaseTest.username, BaseTest.password)
+    workflowURL = client.uploadWorkflow(os.path.join(os.getcwd(), args.workflow), args.topic)
+    generator = LoadGenerator(client, workflowURL, args.interval, args.timeout)
+    summaries = []
+    results = []
+    try:
+        for concurrency in levels:
+            print('Concurrency {0}...'.format(concurrency), file=sys.stderr)
+            records, elapsed = generator.generate(args.runs or 2 * concurrency, concurrency, args.rate)
+            summaries.append(summarise(concurrency, records, elapsed))
+            results.append({'summary': summaries[-1], 'runs': records})
+    finally:
+        generator.cleanup()
+        client.deleteWorkflow(workflowURL)
+
+    printSummaries(summaries, sys.stdout)
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'wt') as f:
+        json.dump({
+            'portal': BaseTest.starturl, 'workflow': args.workflow, 'rate': args.rate,
+            'levels': results,
+            }, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
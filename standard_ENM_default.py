@@ -2,16 +2,16 @@ import platform
 import time
 import unittest
 
-# from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions
-
 from BaseTest import ExistingWorkflowTest, WithFirefox, WithChrome
 
 
 class RunENMWorkflow(ExistingWorkflowTest):
 
     def test_enm_workflow(self):
+        # from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions
+
         link = self.portal.find_element_by_partial_link_text("Ecological Niche Modelling")
         self.portal.click(link)
 
@@ -82,9 +82,8 @@ class RunENMWorkflow(ExistingWorkflowTest):
 class RunENMWorkflowFirefox(RunENMWorkflow, unittest.TestCase, WithFirefox):
     pass
 
-if WithChrome:
-    class RunENMWorkflowChrome(RunENMWorkflow, unittest.TestCase, WithChrome):
-        pass
+class RunENMWorkflowChrome(RunENMWorkflow, unittest.TestCase, WithChrome):
+    pass
 
 
 if __name__ == '__main__':
@@ -0,0 +1,58 @@
+import os, shutil, tempfile, unittest
+
+import Cassette
+import MockPortal
+import PortalClient
+
+WORKFLOW = 't2flow/Rconnect.t2flow'
+
+
+class CassetteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        server = MockPortal.MockPortal(speed=100).serve()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = 'http://{0}:{1}/'.format(*server.server_address)
+        client = PortalClient.PortalClient(self.url)
+        client.signIn('tester', 'secret')
+        self.workflowURL = client.uploadWorkflow(os.path.join(os.getcwd(), WORKFLOW), 'Other')
+        self.cookies = client.session.cookies
+
+    def runOutput(self, cassette):
+        # Run the workflow, and return the cassette client and the download
+        # link of its output
+        client = PortalClient.PortalClient(self.url, cassette=cassette)
+        client.session.cookies.update(self.cookies)
+        runURL = client.startRun(self.workflowURL)
+        client.watchRunStatus(runURL, lambda status: True if status == 'Finished' else None, 30, 0.02)
+        return client, client.get(runURL).getOutputLinks()['out']
+
+    def test_replayOutputOfEarlierRun(self):
+        name = '{0} output out'.format(Cassette.runKey(WORKFLOW))
+        recorder = Cassette.Cassette(self.directory, 'record')
+        client, link = self.runOutput(recorder)
+        recorder.alias(link, name)
+        self.assertEqual(client.downloads.get(link).text, '28364')
+
+        player = Cassette.Cassette(self.directory, 'replay')
+        client, newLink = self.runOutput(player)
+        self.assertNotEqual(newLink, link)
+        player.alias(newLink, name)
+        self.assertEqual(client.downloads.get(newLink).text, '28364')
+
+    def test_missWithoutAlias(self):
+        recorder = Cassette.Cassette(self.directory, 'record')
+        client, link = self.runOutput(recorder)
+        client.downloads.get(link)
+
+        player = Cassette.Cassette(self.directory, 'replay')
+        client, newLink = self.runOutput(player)
+        with self.assertRaises(Cassette.CassetteMiss):
+            client.downloads.get(newLink)
+
+
+if __name__ == '__main__':
+    unittest.main()
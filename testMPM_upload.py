@@ -1,15 +1,15 @@
 import os, platform, unittest, urllib.request
 
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support import expected_conditions
-
 from BaseTest import WorkflowTest, WithFirefox, WithChrome, username
 
 
 class RunMPMWorkflow(WorkflowTest):
 
     def test_tutorial(self):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.common.keys import Keys
+        from selenium.webdriver.support import expected_conditions
+
         run = self.runUploadedWorkflow(
             'BioVeL_POP_MPM/matrix_population_model_analysis_v10.t2flow',
             'Population Modelling',
@@ -58,9 +58,11 @@ class RunMPMWorkflow(WorkflowTest):
 
         results = run.waitForFinish(300, 1)
 
-        for result in results.values():
-            if result.getMimeType() == 'application/x-error':
-                self.fail(result.getValue())
+        errors = results.getErrors()
+        if errors:
+            self.fail('\n---\n'.join(
+                '{0}: {1}'.format(name, message) for name, message in sorted(errors.items())
+                ))
 
 class MPMDefaultInputs:
 
@@ -97,10 +99,9 @@ class MPMTutorialInputs:
 class RunMPMDefaultFirefox(MPMDefaultInputs, RunMPMWorkflow, unittest.TestCase, WithFirefox):
     pass
 
-if WithChrome:
-    @unittest.skipUnless(username, 'No username login provided')
-    class RunMPMDefaultChrome(MPMDefaultInputs, RunMPMWorkflow, unittest.TestCase, WithChrome):
-        pass
+@unittest.skipUnless(username, 'No username login provided')
+class RunMPMDefaultChrome(MPMDefaultInputs, RunMPMWorkflow, unittest.TestCase, WithChrome):
+    pass
 
 # Firefox on Windows hangs on click of Workflow Submit button using Selenium, but
 # not when running workflow manually
@@ -110,10 +111,9 @@ if WithChrome:
 class RunMPMTutorialFirefox(MPMTutorialInputs, RunMPMWorkflow, unittest.TestCase, WithFirefox):
     pass
 
-if WithChrome:
-    @unittest.skipUnless(username, 'No username login provided')
-    class RunMPMTutorialChrome(MPMTutorialInputs, RunMPMWorkflow, unittest.TestCase, WithChrome):
-        pass
+@unittest.skipUnless(username, 'No username login provided')
+class RunMPMTutorialChrome(MPMTutorialInputs, RunMPMWorkflow, unittest.TestCase, WithChrome):
+    pass
 
 if __name__ == '__main__':
     import sys
@@ -0,0 +1,41 @@
+import os, shutil, sys, tempfile, unittest
+
+import ParallelRunner
+
+# A test module run by the workers, which adds a session cleanup that leaves
+# a file in the worker's artifact directory
+PROBE = '''
+import os, unittest
+import BaseTest
+
+class CleanupProbe(unittest.TestCase):
+
+    def test_addCleanup(self):
+        def cleanup():
+            with open(os.path.join(BaseTest.artifactBase, 'cleaned'), 'wt') as f:
+                f.write('ok')
+        BaseTest.addSessionCleanup(cleanup)
+'''
+
+
+class ParallelRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        with open(os.path.join(self.directory, 'parallelCleanupProbe.py'), 'wt') as f:
+            f.write(PROBE)
+        # Spawned workers are given the path of the parent process
+        sys.path.insert(0, self.directory)
+        self.addCleanup(sys.path.remove, self.directory)
+
+    def test_workerSessionCleanupsRun(self):
+        output = os.path.join(self.directory, 'artifacts')
+        status = ParallelRunner.main(['-j', '1', '-o', output, 'parallelCleanupProbe'])
+        self.assertEqual(status, 0)
+        with open(os.path.join(output, 'worker-0', 'cleaned'), 'rt') as f:
+            self.assertEqual(f.read(), 'ok')
+
+
+if __name__ == '__main__':
+    unittest.main()
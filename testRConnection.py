@@ -25,10 +25,9 @@ class RunRConnectionTest(WorkflowTest):
 class RunRConnectionTestFirefox(RunRConnectionTest, unittest.TestCase, WithFirefox):
     pass
 
-if WithChrome:
-    @unittest.skipUnless(username, 'No username login provided')
-    class RunRConnectionTestChrome(RunRConnectionTest, unittest.TestCase, WithChrome):
-        pass
+@unittest.skipUnless(username, 'No username login provided')
+class RunRConnectionTestChrome(RunRConnectionTest, unittest.TestCase, WithChrome):
+    pass
 
 
 if __name__ == '__main__':
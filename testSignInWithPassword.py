@@ -26,10 +26,9 @@ class SignInWithPasswordFirefox(SignInWithPassword, unittest.TestCase, WithFiref
     pass
 
 
-if WithChrome:
-    @unittest.skipUnless(username, 'No username login provided')
-    class SignInWithPasswordChrome(SignInWithPassword, unittest.TestCase, WithChrome):
-        pass
+@unittest.skipUnless(username, 'No username login provided')
+class SignInWithPasswordChrome(SignInWithPassword, unittest.TestCase, WithChrome):
+    pass
 
 
 
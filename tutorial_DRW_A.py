@@ -1,32 +1,38 @@
-import os.path, platform, shutil, tempfile, time, urllib.parse, urllib.request
+import platform, urllib.parse
 import unittest
 
-from selenium.common.exceptions import TimeoutException, UnexpectedAlertPresentException
-from selenium.webdriver import ActionChains
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions
-
 from BaseTest import WorkflowTest, WorkflowRun, WithFirefox, WithChrome
 
 
 class RunDRWWorkflow(WorkflowTest):
 
+    inputFileName = 'inputfile_DRW_lessonA_105recs_v2.csv'
+
     def setUp(self):
         super().setUp()
+        if self.screenshotBase:
+            # Visit the wiki page anyway, for its screenshot
+            self.inputFile = self.fixture(self.inputFileName, self.findInputFileURL())
+        else:
+            self.inputFile = self.fixture(self.inputFileName, self.findInputFileURL)
+
+    def findInputFileURL(self):
         saveURL = self.portal.current_url
         self.portal.get('https://wiki.biovel.eu/x/e4Sz')
         self.screenshot('inputFileOnWiki')
         content = self.portal.find_element_by_id('content')
-        link = content.find_element_by_link_text('inputfile_DRW_lessonA_105recs_v2.csv')
+        link = content.find_element_by_link_text(self.inputFileName)
         fileUrl = link.get_attribute('href')
         fullUrl = urllib.parse.urljoin(self.portal.current_url, fileUrl)
-        tempdir = tempfile.mkdtemp()
-        self.addCleanup(shutil.rmtree, tempdir, ignore_errors=True)
-        self.inputFile = os.path.join(tempdir, 'inputfile_DRW_lessonA_105recs_v2.csv')
-        urllib.request.urlretrieve(fullUrl, self.inputFile)
         self.portal.get(saveURL)
+        return fullUrl
 
     def test_drw_3_1_5(self):
+        from selenium.common.exceptions import TimeoutException, UnexpectedAlertPresentException
+        from selenium.webdriver import ActionChains
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions
+
         self.screenshot('screen-drw-09a')
 
         link = self.portal.find_element_by_partial_link_text("Taxonomic Refinement")
@@ -37,8 +43,8 @@ class RunDRWWorkflow(WorkflowTest):
 
         run = self.runExistingWorkflow('Data Refinement Workflow v15')
         if self.screenshotBase:
-            os.rename(self.screenshotName('WorkflowDetails'), self.screenshotName('screen-drw-10b'))
-            os.rename(self.screenshotName('WorkflowInputs'), self.screenshotName('screen-drw-11a'))
+            self.renameScreenshot('WorkflowDetails', 'screen-drw-10b')
+            self.renameScreenshot('WorkflowInputs', 'screen-drw-11a')
 
         # Store the run URL here, to help with browser restart. If we do this
         # later, we tend to get the interaction page URL instead
@@ -89,8 +95,7 @@ class RunDRWWorkflow(WorkflowTest):
         self.portal.get(runUrl)
 
         # Need to update run to use new portal
-        run = WorkflowRun(self, self.portal)
-        time.sleep(2)
+        run = WorkflowRun(self, self.portal, runUrl)
 
         # Choose Sub-workflow
         with run.waitForInteraction(300) as interaction:
@@ -160,13 +165,14 @@ class RunDRWWorkflow(WorkflowTest):
             mapHeight = mapViewPortElement.size['height']
             mapWidth = mapViewPortElement.size['width']
 
-            with open('file0.html', 'wt') as f:
+            with open(self.artifactName('file0.html'), 'wt') as f:
                 f.write(self.portal.page_source)
 
             # Define the points where we are going to click to make the polygon
             points = [(0.45, 0.5), (0.42, 0.7), (0.53, 0.9), (0.55, 0.5)]
 
             # Draw the polygon
+            polygons = self.portal.polygonCount()
             (prevX, prevY) = points.pop(0)
             chain = ActionChains(self.portal.browser).move_to_element_with_offset(
                 mapViewPortElement, int(prevX*mapWidth), int(prevY*mapHeight)
@@ -178,7 +184,7 @@ class RunDRWWorkflow(WorkflowTest):
                 prevX = x
                 prevY = y
             chain.double_click().perform()
-            time.sleep(5)
+            self.portal.waitForPolygon(polygons, 30)
             self.screenshot('screen-drw-14a', interaction.location, interaction.size)
 
             # Filter elements inside polygon
@@ -188,13 +194,15 @@ class RunDRWWorkflow(WorkflowTest):
                     )
                 )
             self.pause(1)
+            completed = self.portal.ajaxCount()
             filterButton.click()
 
             # We cheat a little here. Removing the layers is tricky using
             # Selenium because the 'no overlay' option is not visible on many
             # displays. Scrolling a menu created using a div and CSS is hard,
             # so we reverse the order of the screenshots to get what we need
-            time.sleep(5)
+            self.portal.waitForAjaxAfter(completed, 30, name='filter applied')
+            self.portal.waitForMapTiles(30, name='filtered map loaded')
             self.screenshot('screen-drw-15a', interaction.location, interaction.size)
 
             dropdown = self.portal.find_element_by_xpath('//div[@id="mapContainerDiv"]//div[@title="Select layer for spatial filtering"]')
@@ -203,12 +211,15 @@ class RunDRWWorkflow(WorkflowTest):
 
             menuItem = dropdown.find_element_by_xpath('..//dt[text()="ETOPO1 Global Relief Model"]')
             self.pause(1)
+            tiles = self.portal.tileSources()
             menuItem.click()
 
             # For screenshot, we let the layer load, and then open the menu again
-            time.sleep(5)
+            self.portal.waitForNewMapTiles(tiles, 30, name='layer loaded')
             dropdown.click()
-            time.sleep(1)
+            self.portal.waitForVisible(
+                (By.XPATH, '//div[@id="mapContainerDiv"]//dt[text()="ETOPO1 Global Relief Model"]'), 10
+                )
             self.screenshot('screen-drw-14b', interaction.location, interaction.size)
 
             # Click ok to save changes and go back to subworkflow chooser
@@ -233,19 +244,22 @@ class RunDRWWorkflow(WorkflowTest):
 
         results = run.waitForFinish(120)
 
-        csv_output = results['csv_output'].getValue()
-        count = csv_output.count('\n')
+        count = results['csv_output'].countLines()
         print(count)
 
     def test_drw_3_1_6(self):
+        from selenium.webdriver import ActionChains
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions
+
         link = self.portal.find_element_by_partial_link_text("Taxonomic Refinement")
         self.pause(1)
         self.portal.click(link)
 
         run = self.runExistingWorkflow('Data Refinement Workflow v15')
         if self.screenshotBase:
-            os.remove(self.screenshotName('WorkflowDetails'))
-            os.remove(self.screenshotName('WorkflowInputs'))
+            self.removeScreenshot('WorkflowDetails')
+            self.removeScreenshot('WorkflowInputs')
 
         # Choose Input file
         with run.waitForInteraction(300):
@@ -299,12 +313,20 @@ class RunDRWWorkflow(WorkflowTest):
                 offsetElement = offsetElement.find_element_by_xpath('..')
             scrollableElement = self.portal.find_element_by_xpath('//*[@id="view-panel"]/div[@class="data-table-container"]')
             self.portal.browser.execute_script("arguments[0].scrollLeft = arguments[1].offsetLeft - 25;", scrollableElement, offsetElement)
-            time.sleep(1)
+            # The header table is moved by Refine's scroll handler, so wait
+            # until the header is within the visible part of the table.
+            self.portal.waitFor('grid scrolled', lambda driver: driver.execute_script(
+                "var header = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;"
+                " if (header === null) return false;"
+                " var rect = header.getBoundingClientRect(), view = arguments[1].getBoundingClientRect();"
+                " return rect.left >= view.left && rect.right <= view.right;",
+                '//*[@id="view-panel"]/div[@class="data-header-table-container"]//span[@class="column-header-name" and text()="nameComplete"]',
+                scrollableElement
+                ), 30)
 
             # Click on the nameComplete dropdown, and click Facet -> Text Facet
             header = viewPanel.find_element_by_xpath('./div[@class="data-header-table-container"]//span[@class="column-header-name" and text()="nameComplete"]')
             dropdown = header.find_element_by_xpath('../a[@class="column-header-menu"]')
-            time.sleep(1)
             dropdown.click()
             facet = self.portal.find_element_by_xpath('/html/body/div[@class="menu-container"]//td[text()="Facet"]')
             self.pause(1)
@@ -315,7 +337,9 @@ class RunDRWWorkflow(WorkflowTest):
                     )
                 )
             ActionChains(self.portal.browser).move_to_element(textFacet).perform()
-            time.sleep(1)
+            self.portal.waitForVisible(
+                (By.XPATH, '/html/body/div[@class="menu-container"]/a[text()="Text facet"]'), 10
+                )
             self.screenshot('screen-drw-16b')
             textFacet.click()
 
@@ -327,8 +351,10 @@ class RunDRWWorkflow(WorkflowTest):
                 )
             self.screenshot('screen-drw-17a')
             self.pause(1)
+            completed = self.portal.ajaxCount()
             speciesName.click()
-            time.sleep(2)
+            self.portal.waitForAjaxAfter(completed, 30, name='facet applied')
+            self.portal.waitForRefineGrid(30, name='facet grid loaded')
             self.screenshot('screen-drw-17b')
 
             # Scroll back to left, click on All dropdown, and click Edit rows
@@ -380,8 +406,7 @@ class RunDRWWorkflow(WorkflowTest):
 
         results = run.waitForFinish(120)
 
-        csv_output = results['csv_output'].getValue()
-        count = csv_output.count('\n')
+        count = results['csv_output'].countLines()
         print(count)
 
         self.screenshot('screen-drw-21a')
@@ -394,9 +419,8 @@ class RunDRWWorkflow(WorkflowTest):
 class RunDRWWorkflowFirefox(RunDRWWorkflow, unittest.TestCase, WithFirefox):
     pass
 
-if WithChrome:
-    class RunDRWWorkflowChrome(RunDRWWorkflow, unittest.TestCase, WithChrome):
-        pass
+class RunDRWWorkflowChrome(RunDRWWorkflow, unittest.TestCase, WithChrome):
+    pass
 
 
 if __name__ == '__main__':